@@ -0,0 +1,48 @@
+# app/json_provider.py
+"""
+orjson-backed JSON provider for Flask.
+
+Installed by create_app() when orjson is importable, so jsonify(),
+request.get_json() and current_app.json.dumps/loads all go through orjson.
+Output matches Flask's DefaultJSONProvider for the types it handles
+(dates are still rendered as HTTP dates, Decimal/UUID as strings) and the
+sort_keys / compact settings are honoured.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    def _options(self, indent: bool = False) -> int:
+        # datetimes go through DefaultJSONProvider.default (http_date) as before
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        # explicit json.dumps arguments (indent=..., cls=...) keep stdlib behaviour
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode("utf-8")
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent))
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
@@ -1,11 +1,50 @@
 from __future__ import annotations
 
+import json
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional
+from typing import Any, Optional
 
 from . import db  # assumes your package-level db = SQLAlchemy() in app/__init__.py
 
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+def _json_loads(value: Any) -> Any:
+    return orjson.loads(value) if orjson is not None else json.loads(value)
+
+
+class JSONDict(db.TypeDecorator):
+    """
+    JSON column that always hands back a dict (or None for NULL). Payloads stored as a
+    JSON-encoded string, or as a non-object value, are normalized when loaded so callers
+    can use .get() on them directly.
+    """
+    impl = db.JSON
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, (str, bytes)):
+            return self.process_result_value(value, dialect)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, dict):
+            return value
+        if isinstance(value, (str, bytes)):
+            try:
+                parsed = _json_loads(value)
+            except Exception:
+                parsed = value
+            if isinstance(parsed, dict):
+                return parsed
+            value = parsed
+        # keep whatever was there rather than dropping it
+        return {"_raw": value}
+
 
 class Order(db.Model):
     __tablename__ = "orders"
@@ -35,6 +74,12 @@ class Order(db.Model):
 
 class Payment(db.Model):
     __tablename__ = "payments"
+    __table_args__ = (
+        # payments-admin listing: date-range filter ordered by created_at desc,
+        # optionally narrowed to a set of statuses
+        db.Index("ix_payments_created_at", "created_at"),
+        db.Index("ix_payments_status_created_at", "status", "created_at"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey(
@@ -53,12 +98,17 @@ class Payment(db.Model):
     payer_email = db.Column(db.String(255))
     payer_id = db.Column(db.String(128))
     # store full capture/response JSON for audits
-    raw_response = db.Column(db.JSON)
+    raw_response = db.Column(JSONDict)
     created_at = db.Column(
         db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow,
                            onupdate=datetime.utcnow, nullable=False)
 
+    # admin audit trail (hold/review/refund/...), oldest first
+    admin_actions = db.relationship(
+        "PaymentAdminAction", backref="payment", lazy="select",
+        order_by="PaymentAdminAction.created_at")
+
     def amount_decimal(self) -> Decimal:
         try:
             return Decimal(str(self.amount or "0"))
@@ -84,6 +134,47 @@ class PayPalWebhookEvent(db.Model):
         return f"<PayPalWebhookEvent id={self.id} event_id={self.event_id} type={self.event_type}>"
 
 
+class PaymentAdminAction(db.Model):
+    """
+    One row per payments-admin action on a Payment (hold, review, refund, ...).
+    Appending is a single INSERT instead of rewriting Payment.raw_response.
+    """
+    __tablename__ = "payment_admin_actions"
+    __table_args__ = (
+        db.Index("ix_payment_admin_actions_payment_id_created_at",
+                 "payment_id", "created_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    payment_id = db.Column(db.Integer, db.ForeignKey(
+        "payments.id"), nullable=False)
+    actor_username = db.Column(db.String(255))
+    actor_role = db.Column(db.String(64))
+    action = db.Column(db.String(40), nullable=False)
+    refund_amount = db.Column(db.Numeric(12, 2))
+    refund_percent = db.Column(db.Numeric(12, 2))
+    note = db.Column(db.Text)
+    # extra context such as provider errors/warnings
+    detail = db.Column(db.JSON)
+    created_at = db.Column(
+        db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "timestamp": self.created_at.isoformat() if self.created_at else None,
+            "actor": {"username": self.actor_username, "role": self.actor_role},
+            "action": self.action,
+            "refund_amount": float(self.refund_amount) if self.refund_amount is not None else None,
+            "refund_percent": float(self.refund_percent) if self.refund_percent is not None else None,
+            "note": self.note,
+            "detail": self.detail,
+        }
+
+    def __repr__(self) -> str:
+        return f"<PaymentAdminAction id={self.id} payment_id={self.payment_id} action={self.action}>"
+
+
 # -------------------------
 # Payments Admin users (top-management accounts)
 # -------------------------
@@ -21,10 +21,13 @@ from __future__ import annotations
 import os
 import time
 import logging
+import threading
 from decimal import Decimal, ROUND_HALF_UP
 from typing import Dict, Any, Optional, List
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import Blueprint, current_app, jsonify, request, render_template_string
 
 paypal_bp = Blueprint("paypal_bp", __name__)
@@ -40,8 +43,21 @@ PAYPAL_CURRENCY = os.environ.get("PAYPAL_CURRENCY", "USD")
 
 PAYPAL_BASE = "https://api-m.sandbox.paypal.com" if PAYPAL_MODE == "sandbox" else "https://api-m.paypal.com"
 
-# tiny in-process cache for OAuth token
+# Shared HTTP session: keeps TCP/TLS connections to PayPal alive between calls.
+# Connection failures are retried; 502/503/504 are retried for idempotent
+# methods only (urllib3 never re-sends a POST on a status code).
+PAYPAL_SESSION = requests.Session()
+PAYPAL_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=2, backoff_factor=0.2,
+                      status_forcelist=(502, 503, 504), raise_on_status=False),
+))
+
+# tiny in-process cache for OAuth token; the lock makes concurrent callers
+# share one OAuth request when the token is missing or expired
 _token_cache: Dict[str, Any] = {}
+_token_lock = threading.Lock()
 
 # Attempt to import persistence models (defensive)
 try:
@@ -57,18 +73,18 @@ except Exception as e:
 
 # Utilities
 def _cache_access_token(token: str, expires_in: int) -> None:
-    _token_cache["token"] = token
-    _token_cache["expires_at"] = time.time() + int(expires_in) - 30
+    # single assignment so readers never see a token without its expiry
+    _token_cache["entry"] = (token, time.time() + int(expires_in) - 30)
 
 
 def _get_cached_token() -> Optional[str]:
-    t = _token_cache.get("token")
-    if not t:
+    entry = _token_cache.get("entry")
+    if not entry:
         return None
-    if time.time() >= _token_cache.get("expires_at", 0):
-        _token_cache.clear()
+    token, expires_at = entry
+    if time.time() >= expires_at:
         return None
-    return t
+    return token
 
 
 def get_paypal_access_token() -> str:
@@ -85,28 +101,33 @@ def get_paypal_access_token() -> str:
             "Missing PayPal credentials (PAYPAL_CLIENT_ID/PAYPAL_SECRET)")
         raise RuntimeError("PayPal credentials not configured on server")
 
-    url = f"{PAYPAL_BASE}/v1/oauth2/token"
-    try:
-        r = requests.post(url, auth=(PAYPAL_CLIENT_ID, PAYPAL_SECRET), data={
-                          "grant_type": "client_credentials"}, timeout=15)
-        r.raise_for_status()
-        js = r.json()
-        token = js.get("access_token")
-        expires_in = int(js.get("expires_in", 300))
-        if not token:
-            raise RuntimeError("No access_token returned from PayPal")
-        _cache_access_token(token, expires_in)
-        return token
-    except Exception as exc:
-        logger.exception("Failed to obtain PayPal access token: %s", exc)
-        raise RuntimeError("Failed to obtain PayPal access token") from exc
+    with _token_lock:
+        # another thread may have refreshed it while we waited
+        token = _get_cached_token()
+        if token:
+            return token
+        url = f"{PAYPAL_BASE}/v1/oauth2/token"
+        try:
+            r = PAYPAL_SESSION.post(url, auth=(PAYPAL_CLIENT_ID, PAYPAL_SECRET), data={
+                              "grant_type": "client_credentials"}, timeout=15)
+            r.raise_for_status()
+            js = r.json()
+            token = js.get("access_token")
+            expires_in = int(js.get("expires_in", 300))
+            if not token:
+                raise RuntimeError("No access_token returned from PayPal")
+            _cache_access_token(token, expires_in)
+            return token
+        except Exception as exc:
+            logger.exception("Failed to obtain PayPal access token: %s", exc)
+            raise RuntimeError("Failed to obtain PayPal access token") from exc
 
 
 def _paypal_get(path: str, token: str) -> Dict[str, Any]:
     url = f"{PAYPAL_BASE}{path}"
     headers = {"Authorization": f"Bearer {token}",
                "Content-Type": "application/json"}
-    r = requests.get(url, headers=headers, timeout=15)
+    r = PAYPAL_SESSION.get(url, headers=headers, timeout=15)
     r.raise_for_status()
     return r.json()
 
@@ -115,7 +136,7 @@ def _paypal_post(path: str, token: str, payload: Dict[str, Any]) -> Dict[str, An
     url = f"{PAYPAL_BASE}{path}"
     headers = {"Authorization": f"Bearer {token}",
                "Content-Type": "application/json"}
-    r = requests.post(url, headers=headers, json=payload, timeout=20)
+    r = PAYPAL_SESSION.post(url, headers=headers, json=payload, timeout=20)
     r.raise_for_status()
     return r.json()
 
@@ -2,38 +2,81 @@
 # routes_payments_admin.py
 from __future__ import annotations
 import os
+import hmac
+import atexit
 import json
+import time
+import queue
+import hashlib
 import logging
+import threading
 from functools import wraps
 from typing import Dict, Any, List, Optional
 
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta, timezone, date
+from decimal import Decimal
 import requests
 
-from flask import Blueprint, request, Response, render_template, jsonify, current_app, abort, session
+from flask import Blueprint, request, Response, render_template, jsonify, current_app, abort, session, g, stream_with_context
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, defer, joinedload, selectinload
+from sqlalchemy.orm.attributes import flag_modified
 from werkzeug.security import check_password_hash, generate_password_hash
 
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+def _json_loads(data: Any) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
 # Import SQLAlchemy models (ensure app/models_payments.py was added and migrations run)
 try:
-    from .models_payments import Payment, Order, PaymentsAdminUser  # type: ignore
+    from .models_payments import Payment, Order, PaymentsAdminUser, PaymentAdminAction  # type: ignore
     from . import db  # type: ignore
 except Exception:
     Payment = None
     Order = None
     PaymentsAdminUser = None
+    PaymentAdminAction = None
     db = None
 
 # Optionally reuse PayPal helper functions if you have payments_paypal implemented
 try:
-    from .payments_paypal import get_paypal_access_token, PAYPAL_BASE  # type: ignore
+    from .payments_paypal import get_paypal_access_token, PAYPAL_BASE, PAYPAL_SESSION  # type: ignore
 except Exception:
     get_paypal_access_token = None
     PAYPAL_BASE = None
+    PAYPAL_SESSION = None
 
 bp = Blueprint("payments_admin", __name__,
                template_folder="templates", url_prefix="/payments-admin")
 logger = logging.getLogger(__name__)
 
+# Session users of the main site admin panel (see routes.py login)
+_SITE_ADMIN_USERS = frozenset({"admin", "admin@example.com"})
+
+def _load_env_admin_users() -> Dict[str, Dict[str, Any]]:
+    """
+    Parse PAYMENTS_ADMIN_USERS once at import, keyed by username. Expected format:
+    PAYMENTS_ADMIN_USERS='[{"username": "...", "password_hash": "<werkzeug hash>", "role": "CFO"}]'
+    """
+    raw_users = os.environ.get("PAYMENTS_ADMIN_USERS", "")
+    if not raw_users:
+        return {}
+    try:
+        return {u["username"]: u for u in _json_loads(raw_users)
+                if isinstance(u, dict) and u.get("username")}
+    except Exception:
+        logger.exception("Failed to parse PAYMENTS_ADMIN_USERS env var")
+        return {}
+
+
+_ENV_ADMIN_USERS = _load_env_admin_users()
+
 # Load admin credentials from environment. Expected format:
 # PAYMENTS_ADMIN_TOKEN='long-random-token'
 
@@ -42,6 +85,54 @@ def _get_admin_token() -> str:
     return os.environ.get("PAYMENTS_ADMIN_TOKEN", "")
 
 
+def _tokens_match(supplied: str, expected: str) -> bool:
+    """Constant-time comparison so response timing doesn't reveal how much of the token matched."""
+    try:
+        return hmac.compare_digest(supplied.encode("utf-8"), expected.encode("utf-8"))
+    except Exception:
+        return False
+
+
+# Successful Basic-auth logins, cached briefly so polling admin UIs don't pay
+# for a DB lookup plus a (deliberately slow) password hash check per request.
+# Keyed by username -> (keyed digest of the password, user info, expiry).
+_AUTH_CACHE_TTL = 60
+_AUTH_CACHE_MAXSIZE = 128
+_AUTH_CACHE_KEY = os.urandom(32)
+_auth_cache: Dict[str, tuple] = {}
+_auth_cache_lock = threading.Lock()
+
+
+def _password_digest(password: str) -> bytes:
+    return hmac.new(_AUTH_CACHE_KEY, (password or "").encode("utf-8"), hashlib.sha256).digest()
+
+
+def _cached_auth(username: str, password: str) -> Optional[Dict[str, str]]:
+    entry = _auth_cache.get(username)
+    if not entry:
+        return None
+    digest, user_info, expires_at = entry
+    if time.monotonic() >= expires_at:
+        _auth_cache.pop(username, None)
+        return None
+    if not hmac.compare_digest(digest, _password_digest(password)):
+        return None
+    return user_info
+
+
+def _remember_auth(username: str, password: str, user_info: Dict[str, str]) -> None:
+    with _auth_cache_lock:
+        if len(_auth_cache) >= _AUTH_CACHE_MAXSIZE:
+            _auth_cache.clear()
+        _auth_cache[username] = (_password_digest(password), user_info,
+                                 time.monotonic() + _AUTH_CACHE_TTL)
+
+
+def _clear_auth_cache() -> None:
+    with _auth_cache_lock:
+        _auth_cache.clear()
+
+
 # Access control decorator: HTTP Basic or header token + role check (now supports DB users)
 def require_payments_admin(f):
     @wraps(f)
@@ -50,11 +141,11 @@ def require_payments_admin(f):
         token = _get_admin_token()
         header_token = request.headers.get(
             "X-ADMIN-TOKEN") or request.args.get("admin_token")
-        if token and header_token and header_token == token:
+        if token and header_token and _tokens_match(header_token, token):
             return f(*args, **kwargs)
 
         # If the current session is a site admin (session-based admin panel), allow
-        if session.get("user") in ("admin", "admin@example.com"):
+        if session.get("user") in _SITE_ADMIN_USERS:
             # session admin may access payments-admin pages for management tasks
             return f(*args, **kwargs)
 
@@ -63,6 +154,11 @@ def require_payments_admin(f):
         if not auth:
             return Response("Authentication required", 401, {"WWW-Authenticate": 'Basic realm="Payments Admin"'})
 
+        cached_user = _cached_auth(auth.username, auth.password)
+        if cached_user is not None:
+            request.payments_admin_user = cached_user
+            return f(*args, **kwargs)
+
         # If PaymentsAdminUser table exists, validate against DB first
         if PaymentsAdminUser is not None:
             try:
@@ -74,6 +170,8 @@ def require_payments_admin(f):
                         # Attach user info for handlers optionally
                         request.payments_admin_user = {
                             "username": u.username, "role": u.role}
+                        _remember_auth(auth.username, auth.password,
+                                       request.payments_admin_user)
                         return f(*args, **kwargs)
                     else:
                         logger.warning(
@@ -87,25 +185,19 @@ def require_payments_admin(f):
 
         # If DB user not found or table missing, fall back to env-based admin list (backwards compatibility)
         # Environment-based list is optional; if not configured we deny.
-        raw_users = os.environ.get("PAYMENTS_ADMIN_USERS", "")
-        if raw_users:
-            try:
-                allowed = json.loads(raw_users)
-                for u in allowed:
-                    if u.get("username") == auth.username:
-                        # check password_hash if present; password_hash must be a werkzeug hash
-                        ph = u.get("password_hash")
-                        if ph and check_password_hash(ph, auth.password or ""):
-                            role = (u.get("role") or "").strip().lower()
-                            if role in ("ceo", "chairman", "cfo"):
-                                request.payments_admin_user = {
-                                    "username": auth.username, "role": u.get("role")}
-                                return f(*args, **kwargs)
-                                # else forbidden
-                # not found in env list, deny
-            except Exception:
-                logger.exception(
-                    "Failed to parse PAYMENTS_ADMIN_USERS env var")
+        u = _ENV_ADMIN_USERS.get(auth.username)
+        if u:
+            # check password_hash if present; password_hash must be a werkzeug hash
+            ph = u.get("password_hash")
+            if ph and check_password_hash(ph, auth.password or ""):
+                role = (u.get("role") or "").strip().lower()
+                if role in ("ceo", "chairman", "cfo"):
+                    request.payments_admin_user = {
+                        "username": auth.username, "role": u.get("role")}
+                    _remember_auth(auth.username, auth.password,
+                                   request.payments_admin_user)
+                    return f(*args, **kwargs)
+        # not found in env list (or bad password/role), deny
         logger.warning("Payments admin auth failed for %s",
                        auth.username if auth else "<no auth>")
         return Response("Forbidden", 403)
@@ -117,7 +209,7 @@ def require_payments_admin(f):
 def require_site_admin_session(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
-        if session.get("user") in ("admin", "admin@example.com"):
+        if session.get("user") in _SITE_ADMIN_USERS:
             return f(*args, **kwargs)
         return jsonify({"error": "Unauthorized"}), 401
     return wrapper
@@ -161,7 +253,7 @@ def api_create_manage_user():
     """
     if PaymentsAdminUser is None or db is None:
         return jsonify({"error": "payments admin users model not available"}), 500
-    data = request.get_json(force=True, silent=True) or {}
+    data = _json_body()
     username = (data.get("username") or "").strip()
     password = data.get("password") or ""
     role = (data.get("role") or "").strip()
@@ -178,6 +270,7 @@ def api_create_manage_user():
         u = PaymentsAdminUser(username=username, password_hash=ph, role=role)
         db.session.add(u)
         db.session.commit()
+        _clear_auth_cache()
         return jsonify({"success": True, "id": u.id, "username": u.username, "role": u.role}), 201
     except Exception as e:
         logger.exception("Failed to create PaymentsAdminUser: %s", e)
@@ -187,74 +280,227 @@ def api_create_manage_user():
 
 # ---------- Utilities & helpers for refunds/actions ----------
 
-def _serialize_payment(p: Any) -> Dict[str, Any]:
-    """Return a JSON-serializable dict for a Payment row (used in responses)."""
+def _json_bytes(obj: Any) -> bytes:
+    """Serialize to UTF-8 JSON bytes (orjson when available)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def _get_order(order_id: Any) -> Any:
+    """Order lookup memoized for the current request (flask.g), so repeated ids hit SQL once."""
+    cache = g.get("order_cache")
+    if cache is None:
+        cache = g.order_cache = {}
+    if order_id not in cache:
+        cache[order_id] = Order.query.get(order_id)
+    return cache[order_id]
+
+
+def _json_body() -> Dict[str, Any]:
+    """Request JSON body, parsed once per request and kept on flask.g ({} if absent or invalid)."""
+    body = g.get("json_body")
+    if body is None:
+        body = g.json_body = request.get_json(silent=True) or {}
+    return body
+
+
+def _serialize_order(o: Any) -> Optional[Dict[str, Any]]:
+    """Summary of the Order linked to a payment, as embedded in payment payloads."""
+    if o is None:
+        return None
+    return {
+        "id": o.id,
+        "order_number": o.order_number,
+        "customer_name": o.customer_name,
+        "customer_email": o.customer_email,
+        "status": o.status,
+        "total_amount": str(o.total_amount) if o.total_amount is not None else None,
+        "currency": o.currency,
+    }
+
+
+def _serialize_payment(p: Any, include_raw: bool = True) -> Dict[str, Any]:
+    """
+    Return a JSON-serializable dict for a Payment row (used in responses).
+    Load p with joinedload(Payment.order) / selectinload(Payment.admin_actions) when
+    serializing many rows; include_raw=False skips the (possibly deferred) raw_response.
+    """
     if p is None:
         return {}
-    try:
-        order = None
-        if getattr(p, "order_id", None) and Order is not None:
-            o = Order.query.get(p.order_id)
-            if o:
-                order = {
-                    "id": o.id,
-                    "order_number": getattr(o, "order_number", None) or None,
-                    "customer_name": getattr(o, "customer_name", None) or None,
-                    "customer_email": getattr(o, "customer_email", None) or None,
-                    "status": getattr(o, "status", None) or None,
-                    "total_amount": str(getattr(o, "total_amount", None)) if getattr(o, "total_amount", None) is not None else None,
-                    "currency": getattr(o, "currency", None) or None,
-                }
-    except Exception:
-        order = None
     try:
         return {
             "id": p.id,
-            "order_id": getattr(p, "order_id", None),
-            "provider": getattr(p, "provider", None),
-            "provider_order_id": getattr(p, "provider_order_id", None),
-            "provider_capture_id": getattr(p, "provider_capture_id", None),
-            "amount": str(getattr(p, "amount", None)),
-            "currency": getattr(p, "currency", None),
-            "status": getattr(p, "status", None),
-            "payer_name": getattr(p, "payer_name", None),
-            "payer_email": getattr(p, "payer_email", None),
-            "payer_id": getattr(p, "payer_id", None),
-            "raw_response": getattr(p, "raw_response", None),
-            "created_at": getattr(p, "created_at").isoformat() if getattr(p, "created_at", None) else None,
-            "order": order
+            "order_id": p.order_id,
+            "provider": p.provider,
+            "provider_order_id": p.provider_order_id,
+            "provider_capture_id": p.provider_capture_id,
+            "amount": str(p.amount),
+            "currency": p.currency,
+            "status": p.status,
+            "payer_name": p.payer_name,
+            "payer_email": p.payer_email,
+            "payer_id": p.payer_id,
+            "raw_response": p.raw_response if include_raw else None,
+            "created_at": p.created_at.isoformat() if p.created_at else None,
+            "order": _serialize_order(p.order) if p.order_id else None,
+            "admin_actions": [a.to_dict() for a in p.admin_actions],
         }
     except Exception:
+        logger.exception("Failed to serialize payment %s", getattr(p, "id", "<unknown>"))
         return {"id": getattr(p, "id", None)}
 
 
-def _append_admin_action(p: Any, action_record: Dict[str, Any]) -> None:
+# action_record keys stored in dedicated PaymentAdminAction columns; anything
+# else (error, warning, provider detail) goes into its JSON `detail` column
+_ADMIN_ACTION_FIELDS = frozenset(
+    {"timestamp", "actor", "action", "refund_amount", "refund_percent", "note"})
+
+
+def _utcnow() -> datetime:
+    """Current UTC time as a naive datetime, matching the naive DateTime columns."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _decimal_or_none(value: Any) -> Optional[Decimal]:
+    """Best-effort conversion for audit amounts; junk or out-of-range input is stored as NULL."""
+    if value is None or value == "":
+        return None
+    try:
+        d = Decimal(str(value))
+    except Exception:
+        return None
+    if not d.is_finite() or abs(d) >= Decimal("1e10"):
+        return None
+    return d
+
+
+def _build_admin_action(p: Any, action_record: Dict[str, Any]) -> Any:
+    actor = action_record.get("actor") or {}
+    detail = {k: v for k, v in action_record.items()
+              if k not in _ADMIN_ACTION_FIELDS}
+    return PaymentAdminAction(
+        payment_id=p.id,
+        actor_username=actor.get("username"),
+        actor_role=actor.get("role"),
+        action=action_record.get("action") or "unknown",
+        refund_amount=_decimal_or_none(action_record.get("refund_amount")),
+        refund_percent=_decimal_or_none(action_record.get("refund_percent")),
+        note=action_record.get("note") or None,
+        detail=detail or None,
+        # stamp now, not when the background writer gets to it
+        created_at=_utcnow(),
+    )
+
+
+# Audit rows that are not part of a status change (failed refund attempts etc.)
+# are written by a background thread so the request doesn't wait on a commit.
+# Rows queued within _ADMIN_ACTION_FLUSH_INTERVAL go out in one transaction.
+# At interpreter exit (worker shutdown/restart) the queue is drained before the
+# process goes away, so queued audit rows are not lost.
+_ADMIN_ACTION_QUEUE: "queue.Queue" = queue.Queue(maxsize=1000)
+_ADMIN_ACTION_FLUSH_INTERVAL = 0.1
+# how long exit waits for the writer to finish the queued rows
+_ADMIN_ACTION_DRAIN_TIMEOUT = 10.0
+_ADMIN_ACTION_STOP = object()
+_admin_action_writer_thread: Optional[threading.Thread] = None
+_admin_action_writer_lock = threading.Lock()
+
+
+def _write_admin_actions(app: Any, rows: List[Any]) -> None:
+    """Commit rows in their own session: never the one a request is using."""
+    with app.app_context():
+        with Session(db.engine) as s:
+            s.add_all(rows)
+            s.commit()
+
+
+def _admin_action_writer() -> None:
+    while True:
+        items = [_ADMIN_ACTION_QUEUE.get()]
+        if items[0] is not _ADMIN_ACTION_STOP:
+            time.sleep(_ADMIN_ACTION_FLUSH_INTERVAL)
+        while True:
+            try:
+                items.append(_ADMIN_ACTION_QUEUE.get_nowait())
+            except queue.Empty:
+                break
+        stop = False
+        by_app: Dict[Any, List[Any]] = {}
+        for item in items:
+            if item is _ADMIN_ACTION_STOP:
+                stop = True
+                continue
+            app, row = item
+            by_app.setdefault(app, []).append(row)
+        for app, rows in by_app.items():
+            try:
+                _write_admin_actions(app, rows)
+            except Exception:
+                logger.exception("Failed to persist %d queued admin action(s)", len(rows))
+        if stop:
+            return
+
+
+def _drain_admin_actions() -> None:
+    """atexit: let the writer commit everything queued, then stop it."""
+    thread = _admin_action_writer_thread
+    if thread is None or not thread.is_alive():
+        return
+    try:
+        _ADMIN_ACTION_QUEUE.put(_ADMIN_ACTION_STOP, timeout=_ADMIN_ACTION_DRAIN_TIMEOUT)
+    except queue.Full:
+        pass
+    thread.join(_ADMIN_ACTION_DRAIN_TIMEOUT)
+    if thread.is_alive():
+        logger.error("Admin action writer did not finish; %d audit record(s) may be lost",
+                     _ADMIN_ACTION_QUEUE.qsize())
+
+
+def _enqueue_admin_action(row: Any) -> None:
+    global _admin_action_writer_thread
+    if _admin_action_writer_thread is None:
+        with _admin_action_writer_lock:
+            if _admin_action_writer_thread is None:
+                thread = threading.Thread(target=_admin_action_writer,
+                                          name="payments-admin-audit", daemon=True)
+                thread.start()
+                _admin_action_writer_thread = thread
+                atexit.register(_drain_admin_actions)
+    app = current_app._get_current_object()
+    try:
+        _ADMIN_ACTION_QUEUE.put_nowait((app, row))
+    except queue.Full:
+        logger.warning("Admin action queue full; writing audit record inline")
+        # separate session: the request's pending changes are neither
+        # committed nor rolled back by this write
+        _write_admin_actions(app, [row])
+
+
+def _append_admin_action(p: Any, action_record: Dict[str, Any], commit: bool = True) -> None:
     """
-    Append an admin action record into p.raw_response['_admin_actions'] (creates it if necessary)
-    and persist p to DB. Best-effort; failures are non-fatal beyond logging.
+    Record an admin action for payment p as a PaymentAdminAction row.
+    With commit=False the row is added to the current session so the caller commits it
+    together with its own updates (status changes). With commit=True (default) it is
+    a standalone record and is handed to the background writer, which writes it in
+    its own session (the request session is never committed or rolled back here).
+    Failures are non-fatal beyond logging.
     """
     try:
         if p is None:
             return
-        rr = getattr(p, "raw_response", None) or {}
-        if not isinstance(rr, dict):
-            # if it's JSON string, try parse
+        row = _build_admin_action(p, action_record)
+        if commit:
+            _enqueue_admin_action(row)
+        else:
+            db.session.add(row)
+    except Exception:
+        if not commit:
             try:
-                rr = json.loads(rr)
+                db.session.rollback()
             except Exception:
-                rr = {}
-        actions = rr.get("_admin_actions", [])
-        actions.append(action_record)
-        rr["_admin_actions"] = actions
-        p.raw_response = rr
-        db.session.add(p)
-        db.session.commit()
-    except Exception:
-        try:
-            db.session.rollback()
-        except Exception:
-            pass
-        logger.exception("Failed to persist admin action for payment %s", getattr(p, "id", "<unknown>"))
+                pass
+        logger.exception("Failed to record admin action for payment %s", getattr(p, "id", "<unknown>"))
 
 
 def _call_paypal_refund(capture_id: str, amount: Optional[float], currency: str, note: str) -> Dict[str, Any]:
@@ -273,11 +519,25 @@ def _call_paypal_refund(capture_id: str, amount: Optional[float], currency: str,
         payload["amount"] = {"value": f"{float(amount):.2f}", "currency_code": (currency or "USD")}
     if note:
         payload["note_to_payer"] = note
-    r = requests.post(url, headers=headers, json=payload or {}, timeout=20)
+    # pooled keep-alive session shared with the checkout flow
+    http = PAYPAL_SESSION or requests
+    r = http.post(url, headers=headers, json=payload or {}, timeout=20)
     r.raise_for_status()
     return r.json()
 
 
+def _commit_and_serialize(payment: Any) -> Dict[str, Any]:
+    """
+    Flush pending changes, serialize payment, then commit. Serializing before the commit
+    reuses the loaded row and order instead of re-SELECTing what expire_on_commit drops.
+    Raises if the flush/commit fails; the caller rolls back.
+    """
+    db.session.flush()
+    data = _serialize_payment(payment)
+    db.session.commit()
+    return data
+
+
 def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[float], refund_percent: Optional[float], note: str, actor: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     """
     Perform admin action on a Payment record.
@@ -287,7 +547,9 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
     note: optional text to store/send
     actor: optional dict { username, role } for audit record
 
-    Returns dict { success: bool, message: str, updated_payment?: {...}, refund_response?: {...} }
+    Returns dict { success: bool, message: str, updated_payment?: {...}, refund_response?: {...} }.
+    Failures that should not be answered with 200 carry an HTTP status under "_status";
+    callers pop it before serializing.
     """
     if payment is None:
         return {"success": False, "message": "payment_not_found"}
@@ -317,7 +579,7 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
 
     # Build audit record
     action_record = {
-        "timestamp": __import__("datetime").datetime.utcnow().isoformat(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
         "actor": actor or {"username": getattr(request, "payments_admin_user", {}).get("username", "unknown")},
         "action": action,
         "refund_amount": resolved_refund_amount,
@@ -328,10 +590,11 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
     # If action is hold -> mark status and persist
     if action in ("hold", "on_hold"):
         payment.status = "on_hold"
-        _append_admin_action(payment, action_record)
+        # status change and audit record go out in one commit
+        _append_admin_action(payment, action_record, commit=False)
         try:
             db.session.add(payment)
-            db.session.commit()
+            updated = _commit_and_serialize(payment)
         except Exception:
             try:
                 db.session.rollback()
@@ -339,15 +602,16 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
                 pass
             logger.exception("Failed to persist on_hold status for payment %s", payment.id)
             return {"success": False, "message": "db_persist_failed"}
-        return {"success": True, "message": "payment_on_hold", "updated_payment": _serialize_payment(payment)}
+        return {"success": True, "message": "payment_on_hold", "updated_payment": updated}
 
     # review/disputed
     if action in ("review", "dispute", "disputed"):
         payment.status = "disputed"
-        _append_admin_action(payment, action_record)
+        # status change and audit record go out in one commit
+        _append_admin_action(payment, action_record, commit=False)
         try:
             db.session.add(payment)
-            db.session.commit()
+            updated = _commit_and_serialize(payment)
         except Exception:
             try:
                 db.session.rollback()
@@ -355,7 +619,7 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
                 pass
             logger.exception("Failed to persist disputed status for payment %s", payment.id)
             return {"success": False, "message": "db_persist_failed"}
-        return {"success": True, "message": "payment_marked_disputed", "updated_payment": _serialize_payment(payment)}
+        return {"success": True, "message": "payment_marked_disputed", "updated_payment": updated}
 
     # rejected/settled: admin rejects the customer's claim -> funds stay with merchant (treat as settled sales)
     if action in ("rejected", "settled", "reject"):
@@ -365,7 +629,7 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
             # if there's an associated Order model (payments.models_payments.Order), mark order as paid/settled
             try:
                 if getattr(payment, "order_id", None) and Order is not None:
-                    o = Order.query.get(payment.order_id)
+                    o = _get_order(payment.order_id)
                     if o:
                         # Mark as paid; chosen canonical value is 'paid'
                         o.status = "paid"
@@ -373,10 +637,10 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
             except Exception:
                 # non-fatal if order update fails
                 logger.exception("Failed to update linked order status for payment %s", getattr(payment, "id", "<unknown>"))
-            _append_admin_action(payment, action_record)
+            _append_admin_action(payment, action_record, commit=False)
             try:
                 db.session.add(payment)
-                db.session.commit()
+                updated = _commit_and_serialize(payment)
             except Exception:
                 try:
                     db.session.rollback()
@@ -384,7 +648,7 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
                     pass
                 logger.exception("Failed to persist settled/rejected status for payment %s", payment.id)
                 return {"success": False, "message": "db_persist_failed"}
-            return {"success": True, "message": "payment_settled_rejected", "updated_payment": _serialize_payment(payment)}
+            return {"success": True, "message": "payment_settled_rejected", "updated_payment": updated}
         except Exception as e:
             logger.exception("Unexpected error applying rejected/settled action to payment %s: %s", getattr(payment, "id", "<unknown>"), e)
             return {"success": False, "message": "rejected_action_failed", "detail": str(e)}
@@ -399,17 +663,18 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
         if provider != "paypal":
             # record admin intent but do not call provider
             action_record["warning"] = f"provider_{provider}_unsupported_for_refund"
-            _append_admin_action(payment, action_record)
+            _append_admin_action(payment, action_record, commit=False)
             payment.status = "refund_pending"
             try:
                 db.session.add(payment)
-                db.session.commit()
+                updated = _commit_and_serialize(payment)
             except Exception:
                 try:
                     db.session.rollback()
                 except Exception:
                     pass
-            return {"success": False, "message": "unsupported_provider_for_refund", "updated_payment": _serialize_payment(payment)}
+                updated = _serialize_payment(payment)
+            return {"success": False, "message": "unsupported_provider_for_refund", "updated_payment": updated}
 
         if not capture_id:
             _append_admin_action(payment, {**action_record, "error": "no_capture_id"})
@@ -420,29 +685,26 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
             refund_resp = _call_paypal_refund(capture_id=capture_id, amount=resolved_refund_amount, currency=currency, note=note)
             # Persist refund info to raw_response._refunds and update status
             try:
-                rr = getattr(payment, "raw_response", None) or {}
-                if not isinstance(rr, dict):
-                    try:
-                        rr = json.loads(rr)
-                    except Exception:
-                        rr = {}
+                rr = payment.raw_response or {}
                 # ensure _refunds list
                 rf_list = rr.get("_refunds", [])
                 rf_list.append(refund_resp)
                 rr["_refunds"] = rf_list
-                # append admin action as well
-                rr.setdefault("_admin_actions", []).append(action_record)
                 payment.raw_response = rr
+                flag_modified(payment, "raw_response")
                 payment.status = "refunded"
+                # audit record goes out in the same commit
+                _append_admin_action(payment, action_record, commit=False)
                 db.session.add(payment)
-                db.session.commit()
+                updated = _commit_and_serialize(payment)
             except Exception:
                 try:
                     db.session.rollback()
                 except Exception:
                     pass
                 logger.exception("Failed to persist refund info for payment %s", payment.id)
-            return {"success": True, "message": "refund_initiated", "refund_response": refund_resp, "updated_payment": _serialize_payment(payment)}
+                updated = _serialize_payment(payment)
+            return {"success": True, "message": "refund_initiated", "refund_response": refund_resp, "updated_payment": updated}
         except requests.HTTPError as he:
             logger.exception("PayPal refund HTTP error for capture %s: %s", capture_id, he)
             try:
@@ -451,11 +713,11 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
                 details = {"error": str(he)}
             # Persist failed attempt as admin action
             _append_admin_action(payment, {**action_record, "error": "paypal_refund_failed", "detail": details})
-            return {"success": False, "message": "paypal_refund_failed", "detail": details}, 502
+            return {"success": False, "message": "paypal_refund_failed", "detail": details, "_status": 502}
         except Exception as e:
             logger.exception("Unexpected refund error for capture %s: %s", capture_id, e)
             _append_admin_action(payment, {**action_record, "error": "refund_failed", "detail": str(e)})
-            return {"success": False, "message": "refund_failed", "detail": str(e)}, 500
+            return {"success": False, "message": "refund_failed", "detail": str(e), "_status": 500}
 
     # Unknown action
     return {"success": False, "message": "unknown_action"}
@@ -471,6 +733,51 @@ def _parse_iso_date_str(d: str) -> date:
     return date.fromisoformat(d)
 
 
+# duration -> (start, end) in days relative to today 00:00 UTC; an end of None
+# means "until now", and "all" (None) applies no date filter. "custom" is
+# handled separately from the from/to query params.
+_DURATION_OFFSETS = {
+    "daily": (0, 1),
+    "today": (0, 1),
+    "yesterday": (-1, 0),
+    "weekly": (-6, None),    # last 7 days including today
+    "week": (-6, None),
+    "monthly": (-29, None),  # last 30 days including today
+    "month": (-29, None),
+    "yearly": (-364, None),  # last 365 days
+    "year": (-364, None),
+    "all": None,
+}
+
+# status/category filter -> the exact Payment.status values it covers. Statuses
+# are stored lowercase (admin actions above, PayPal capture status lowercased),
+# so IN over these sets can use ix_payments_status_created_at where the old
+# ILIKE '%...%' patterns could not.
+_REFUND_STATUSES = frozenset({"refunded", "refund_pending", "partially_refunded"})
+_DISPUTED_STATUSES = frozenset({"disputed"})
+_HOLD_STATUSES = frozenset({"on_hold"})
+_SETTLED_STATUSES = frozenset({"settled"})
+_STATUS_FILTERS = {
+    "refunded": _REFUND_STATUSES,
+    "refund": _REFUND_STATUSES,
+    "disputed": _DISPUTED_STATUSES,
+    "disput": _DISPUTED_STATUSES,
+    "on_hold": _HOLD_STATUSES,
+    "hold": _HOLD_STATUSES,
+    "held": _HOLD_STATUSES,
+    "settled": _SETTLED_STATUSES,
+    "rejected": _SETTLED_STATUSES,
+    "rejected_settled": _SETTLED_STATUSES,
+}
+# legacy frontend category keys; others (cash-in, today, ...) are client-side
+_CATEGORY_FILTERS = {
+    "refunded": _REFUND_STATUSES,
+    "disputed": _DISPUTED_STATUSES,
+    "settled": _SETTLED_STATUSES,
+    "rejected": _SETTLED_STATUSES,
+}
+
+
 @bp.route("/api/payments", methods=["GET"])
 @require_payments_admin
 def api_list_payments():
@@ -497,31 +804,13 @@ def api_list_payments():
         # frontend historically omitted 'duration' for daily — treat missing as daily
         duration = "daily"
 
-    now = datetime.utcnow()
+    now = _utcnow()
     today_start = datetime(now.year, now.month, now.day)
     start_dt = None
     end_dt = None
 
     try:
-        if duration in ("daily", "today"):
-            start_dt = today_start
-            end_dt = today_start + timedelta(days=1)
-        elif duration == "yesterday":
-            start_dt = today_start - timedelta(days=1)
-            end_dt = today_start
-        elif duration in ("weekly", "week"):
-            # last 7 days including today
-            start_dt = today_start - timedelta(days=6)
-            end_dt = now
-        elif duration in ("monthly", "month"):
-            # last 30 days including today
-            start_dt = today_start - timedelta(days=29)
-            end_dt = now
-        elif duration in ("yearly", "year"):
-            # last 365 days
-            start_dt = today_start - timedelta(days=364)
-            end_dt = now
-        elif duration == "custom":
+        if duration == "custom":
             from_str = (request.args.get("from") or request.args.get("from_date") or "").strip()
             to_str = (request.args.get("to") or request.args.get("to_date") or "").strip()
             if not from_str or not to_str:
@@ -534,21 +823,28 @@ def api_list_payments():
             start_dt = datetime(d_from.year, d_from.month, d_from.day)
             # make end exclusive (next day after 'to')
             end_dt = datetime(d_to.year, d_to.month, d_to.day) + timedelta(days=1)
-        elif duration == "all":
-            start_dt = None
-            end_dt = None
         else:
             # Unknown duration — treat as daily by default to be safe
-            start_dt = today_start
-            end_dt = today_start + timedelta(days=1)
+            offsets = _DURATION_OFFSETS.get(duration, _DURATION_OFFSETS["daily"])
+            if offsets is not None:
+                start_off, end_off = offsets
+                start_dt = today_start + timedelta(days=start_off)
+                end_dt = now if end_off is None else today_start + timedelta(days=end_off)
     except Exception:
         # If anything goes wrong computing dates, fall back to no date filter (safer)
         logger.exception("Failed to compute duration bounds for %s", duration)
         start_dt = None
         end_dt = None
 
-    # Base query
-    q = Payment.query
+    # Base query; the linked order is joined in so serializing a page costs one query
+    q = Payment.query.options(joinedload(Payment.order), selectinload(Payment.admin_actions))
+
+    # raw_response holds the full provider payload plus refund/admin history and
+    # dominates row size; callers that don't render it can pass include_raw=0
+    # to leave the column out of the SELECT entirely.
+    include_raw = (request.args.get("include_raw") or "1").strip().lower() not in ("0", "false", "no")
+    if not include_raw:
+        q = q.options(defer(Payment.raw_response))
 
     # Apply date range filters if computed
     if start_dt is not None and end_dt is not None:
@@ -563,74 +859,75 @@ def api_list_payments():
         except Exception:
             logger.exception("Failed to apply created_at >= filter; ignoring date filter")
 
-    q = q.order_by(Payment.created_at.desc())
+    # id breaks ties so keyset cursors below are unambiguous
+    q = q.order_by(Payment.created_at.desc(), Payment.id.desc())
 
     # Optional server-side filters (simple)
     status_filter = (request.args.get("status") or "").strip().lower()
     category = (request.args.get("category") or "").strip().lower()  # alternate param
     if status_filter:
-        if status_filter in ("refunded", "refund"):
-            q = q.filter(Payment.status.ilike("%refund%"))
-        elif status_filter in ("disputed", "disput"):
-            q = q.filter(Payment.status.ilike("%disput%"))
-        elif status_filter in ("on_hold", "hold", "held"):
-            q = q.filter(Payment.status.ilike("%hold%") | (Payment.status == "on_hold"))
-        elif status_filter in ("settled", "rejected", "rejected_settled"):
-            q = q.filter(Payment.status.ilike("%settle%") | (Payment.status == "settled"))
+        statuses = _STATUS_FILTERS.get(status_filter)
+        if statuses is not None:
+            q = q.filter(Payment.status.in_(statuses))
         else:
-            q = q.filter(Payment.status.ilike(f"%{status_filter}%"))
-    elif category:
-        # support legacy category keys from frontend (cash-in, today, prev-day, filtered)
-        cat = category
-        if cat == "refunded":
-            q = q.filter(Payment.status.ilike("%refund%"))
-        elif cat == "disputed":
-            q = q.filter(Payment.status.ilike("%disput%"))
-        elif cat in ("settled", "rejected"):
-            q = q.filter(Payment.status.ilike("%settle%") | (Payment.status == "settled"))
-        # else do nothing (frontend can still handle client-side)
-
-    pagination = q.paginate(page=page, per_page=per_page, error_out=False)
-
-    items = []
-    for p in pagination.items:
-        order = None
-        if p.order_id and Order is not None:
-            o = Order.query.get(p.order_id)
-            if o:
-                order = {
-                    "id": o.id,
-                    "order_number": getattr(o, "order_number", None) or None,
-                    "customer_name": getattr(o, "customer_name", None) or None,
-                    "customer_email": getattr(o, "customer_email", None) or None,
-                    "status": getattr(o, "status", None) or None,
-                    "total_amount": str(getattr(o, "total_amount", None)) if getattr(o, "total_amount", None) is not None else None,
-                    "currency": getattr(o, "currency", None) or None,
-                }
-        items.append({
-            "id": p.id,
-            "order_id": p.order_id,
-            "provider": p.provider,
-            "provider_order_id": p.provider_order_id,
-            "provider_capture_id": p.provider_capture_id,
-            "amount": str(p.amount),
-            "currency": p.currency,
-            "status": p.status,
-            "payer_name": p.payer_name,
-            "payer_email": p.payer_email,
-            "payer_id": p.payer_id,
-            "raw_response": p.raw_response,
-            "created_at": p.created_at.isoformat() if p.created_at else None,
-            "order": order
-        })
+            q = q.filter(Payment.status == status_filter)
+    elif category in _CATEGORY_FILTERS:
+        q = q.filter(Payment.status.in_(_CATEGORY_FILTERS[category]))
+
+    # Keyset pagination (paging=keyset, or a cursor from a previous response's
+    # next_cursor): seeks past (created_at, id) and skips the COUNT(*) that
+    # page-number pagination needs. Without it, the classic paginated envelope
+    # with page/total/pages is returned.
+    after_created_at = (request.args.get("after_created_at") or "").strip()
+    after_id = (request.args.get("after_id") or "").strip()
+    keyset = (request.args.get("paging") or "").strip().lower() == "keyset"
+    if keyset or (after_created_at and after_id):
+        if after_created_at and after_id:
+            try:
+                cursor_ts = datetime.fromisoformat(after_created_at)
+                cursor_id = int(after_id)
+            except Exception:
+                return jsonify({"error": "invalid_cursor"}), 400
+            q = q.filter(tuple_(Payment.created_at, Payment.id) < (cursor_ts, cursor_id))
+        rows = q.limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        next_cursor = None
+        if has_more and rows:
+            last = rows[-1]
+            next_cursor = {"after_created_at": last.created_at.isoformat(), "after_id": last.id}
+        meta = {"per_page": per_page, "next_cursor": next_cursor}
+    else:
+        pagination = q.paginate(page=page, per_page=per_page, error_out=False)
+        rows = pagination.items
+        meta = {
+            "page": pagination.page,
+            "per_page": pagination.per_page,
+            "total": pagination.total,
+            "pages": pagination.pages
+        }
 
-    return jsonify({
-        "items": items,
-        "page": pagination.page,
-        "per_page": pagination.per_page,
-        "total": pagination.total,
-        "pages": pagination.pages
-    })
+    def generate():
+        # Serialize row by row so a 200-row page never exists as one big list
+        # of dicts plus one big JSON string; flush roughly every 64 KB.
+        buf = [b'{"items":[']
+        size = 0
+        for i, p in enumerate(rows):
+            chunk = _json_bytes(_serialize_payment(p, include_raw))
+            if i:
+                buf.append(b",")
+            buf.append(chunk)
+            size += len(chunk)
+            if size >= 65536:
+                yield b"".join(buf)
+                buf = []
+                size = 0
+        # meta object without its opening brace closes the envelope
+        buf.append(b"],")
+        buf.append(_json_bytes(meta)[1:])
+        yield b"".join(buf)
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
 
 
 @bp.route("/api/payments/<int:payment_id>", methods=["GET"])
@@ -638,39 +935,12 @@ def api_list_payments():
 def api_payment_detail(payment_id: int):
     if Payment is None:
         return jsonify({"error": "payments model not available"}), 500
-    p = Payment.query.get(payment_id)
+    p = Payment.query.options(
+        joinedload(Payment.order), selectinload(Payment.admin_actions)
+    ).filter_by(id=payment_id).first()
     if not p:
         return jsonify({"error": "not_found"}), 404
-    order = None
-    if p.order_id and Order is not None:
-        o = Order.query.get(p.order_id)
-        if o:
-            order = {
-                "id": o.id,
-                "order_number": getattr(o, "order_number", None) or None,
-                "customer_name": getattr(o, "customer_name", None) or None,
-                "customer_email": getattr(o, "customer_email", None) or None,
-                "status": getattr(o, "status", None) or None,
-                "total_amount": str(getattr(o, "total_amount", None)) if getattr(o, "total_amount", None) is not None else None,
-                "currency": getattr(o, "currency", None) or None,
-            }
-    resp = {
-        "id": p.id,
-        "order_id": p.order_id,
-        "provider": p.provider,
-        "provider_order_id": p.provider_order_id,
-        "provider_capture_id": p.provider_capture_id,
-        "amount": str(p.amount),
-        "currency": p.currency,
-        "status": p.status,
-        "payer_name": p.payer_name,
-        "payer_email": p.payer_email,
-        "payer_id": p.payer_id,
-        "raw_response": p.raw_response,
-        "created_at": p.created_at.isoformat() if p.created_at else None,
-        "order": order
-    }
-    return jsonify(resp)
+    return jsonify(_serialize_payment(p))
 
 
 # Backwards-compatible endpoint that accepts structured payload via URL path
@@ -684,11 +954,14 @@ def api_payment_refund(payment_id: int):
     """
     if Payment is None:
         return jsonify({"error": "payments model not available"}), 500
-    p = Payment.query.get(payment_id)
+    if not request.is_json:
+        return jsonify({"error": "content_type", "message": "expected application/json"}), 415
+    # the order is part of the updated_payment response; fetch it in the same query
+    p = db.session.get(Payment, payment_id, options=[joinedload(Payment.order)])
     if not p:
         return jsonify({"error": "not_found"}), 404
 
-    data = request.get_json(force=True, silent=True) or {}
+    data = _json_body()
     action = (data.get("action") or "refund").strip().lower()
     refund_amount = data.get("refund_amount") if "refund_amount" in data else data.get("amount")
     refund_percent = data.get("refund_percent")
@@ -696,11 +969,8 @@ def api_payment_refund(payment_id: int):
 
     actor = getattr(request, "payments_admin_user", None) or {"username": session.get("user", "unknown")}
     result = _perform_payment_action(p, action=action, refund_amount=refund_amount, refund_percent=refund_percent, note=note, actor=actor)
-    # _perform_payment_action may return a tuple-like (dict, status) in error cases (HTTPError path). Normalize:
-    if isinstance(result, tuple):
-        body, status = result
-        return jsonify(body), status
-    return jsonify(result)
+    status = result.pop("_status", 200)
+    return jsonify(result), status
 
 
 # New generic refund/action endpoint expected by updated frontend:
@@ -722,7 +992,9 @@ def api_payment_refund_generic():
     """
     if Payment is None:
         return jsonify({"error": "payments model not available"}), 500
-    data = request.get_json(force=True, silent=True) or {}
+    if not request.is_json:
+        return jsonify({"error": "content_type", "message": "expected application/json"}), 415
+    data = _json_body()
     payment_id = data.get("payment_id") or data.get("paymentId") or data.get("id")
     if not payment_id:
         return jsonify({"error": "payment_id required"}), 400
@@ -730,7 +1002,7 @@ def api_payment_refund_generic():
         pid = int(payment_id)
     except Exception:
         return jsonify({"error": "invalid_payment_id"}), 400
-    p = Payment.query.get(pid)
+    p = db.session.get(Payment, pid, options=[joinedload(Payment.order)])
     if not p:
         return jsonify({"error": "payment_not_found"}), 404
 
@@ -741,7 +1013,5 @@ def api_payment_refund_generic():
 
     actor = getattr(request, "payments_admin_user", None) or {"username": session.get("user", "unknown")}
     result = _perform_payment_action(p, action=action, refund_amount=refund_amount, refund_percent=refund_percent, note=note, actor=actor)
-    if isinstance(result, tuple):
-        body, status = result
-        return jsonify(body), status
-    return jsonify(result)
\ No newline at end of file
+    status = result.pop("_status", 200)
+    return jsonify(result), status
\ No newline at end of file
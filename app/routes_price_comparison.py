@@ -5,6 +5,7 @@ import json
 from urllib.parse import quote_plus
 from flask import Blueprint, render_template, request, jsonify, current_app
 from .models import Product, Setting
+from . import db
 
 price_cmp_bp = Blueprint("price_cmp_bp", __name__)
 
@@ -49,7 +50,7 @@ def api_price_compare():
 
     # Load competitors from Setting; accept stored JSON or fallback to defaults
     try:
-        s = Setting.query.get("price_comparison_competitors")
+        s = db.session.get(Setting, "price_comparison_competitors")
         if s and s.value:
             try:
                 competitors = json.loads(s.value)
@@ -66,7 +67,7 @@ def api_price_compare():
 
     # global margin
     try:
-        gm = Setting.query.get("price_comparison_global_margin")
+        gm = db.session.get(Setting, "price_comparison_global_margin")
         global_margin = float(gm.value) if gm and gm.value is not None else 0.0
     except Exception:
         global_margin = 0.0
@@ -9,49 +9,135 @@ Provides:
 - PUT  /api/settings/price_comparison    -> { "success": True }
 - POST /api/settings/price_comparison/push -> { "success": True }
 """
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Sequence, Tuple
+
 from flask import Blueprint, request, jsonify, current_app, session
+from sqlalchemy.exc import SQLAlchemyError
 from .models import Setting
 from . import db
-import json
 
 settings_bp = Blueprint("settings_bp", __name__)
 
+# session users allowed to change settings
+_ADMIN_USERS = frozenset({"admin", "admin@example.com"})
+
+
+def admin_required(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if session.get("user") not in _ADMIN_USERS:
+            return jsonify({"error": "Unauthorized"}), 401
+        return f(*args, **kwargs)
+    return wrapper
+
+
+# Parsed settings, per process: name -> (loaded_at, version, value). Settings only
+# change through the PUT handlers below, which drop their entry; other workers
+# notice the change within _SETTING_CACHE_TTL seconds. On expiry the backing rows'
+# updated_at values are probed first and the value is only re-loaded and re-parsed
+# when they moved.
+_SETTING_CACHE: Dict[str, Tuple[float, Any, Any]] = {}
+_SETTING_CACHE_TTL = 30.0
+
+
+def _settings_version(keys: Sequence[str]) -> Tuple[Any, ...]:
+    """(key, updated_at) pairs for the given Setting keys, without loading their values."""
+    rows = db.session.query(Setting.key, Setting.updated_at).filter(
+        Setting.key.in_(keys)).all()
+    return tuple(sorted((k, u) for k, u in rows))
+
+
+def get_setting_cached(name: str, keys: Sequence[str], loader: Callable[[], Any],
+                       ttl: float = _SETTING_CACHE_TTL) -> Any:
+    """
+    Return loader()'s value for cache entry name, built from the Setting rows in keys.
+    Fresh entries are served without touching the DB; DB errors propagate.
+    """
+    now = time.monotonic()
+    hit = _SETTING_CACHE.get(name)
+    if hit is not None and now - hit[0] < ttl:
+        return hit[2]
+    version = _settings_version(keys)
+    if hit is not None and hit[1] == version:
+        _SETTING_CACHE[name] = (now, version, hit[2])
+        return hit[2]
+    value = loader()
+    _SETTING_CACHE[name] = (now, version, value)
+    return value
+
+
+def _load_checkout_discount() -> float:
+    s = db.session.get(Setting, "checkout_discount")
+    try:
+        return float(s.value) if s and s.value is not None else 0.0
+    except Exception:
+        return 0.0
+
+
+# both price-comparison rows are always read (and written) together
+_PRICE_COMPARISON_KEYS = ("price_comparison_competitors",
+                          "price_comparison_global_margin")
+
+
+def _fetch_settings(keys) -> Dict[str, Any]:
+    """Load several Setting rows in one query; returns {key: Setting} for those that exist."""
+    return {r.key: r for r in Setting.query.filter(Setting.key.in_(keys)).all()}
+
+
+def _load_price_comparison() -> Dict[str, Any]:
+    rows = _fetch_settings(_PRICE_COMPARISON_KEYS)
+    s = rows.get("price_comparison_competitors")
+    competitors = []
+    if s and s.value:
+        try:
+            competitors = current_app.json.loads(s.value)
+        except Exception:
+            current_app.logger.debug(
+                "Invalid JSON in price_comparison_competitors setting; returning empty list")
+            competitors = []
+
+    gm = rows.get("price_comparison_global_margin")
+    global_margin = 0.0
+    try:
+        global_margin = float(
+            gm.value) if gm and gm.value is not None else 0.0
+    except Exception:
+        global_margin = 0.0
+    return {"competitors": competitors, "global_margin": global_margin}
+
 
 @settings_bp.route("/api/settings/checkout_discount", methods=["GET"])
 def get_checkout_discount():
     """
     Return JSON: { "percent": 2.5 }
     Public endpoint (frontend reads it to show advert).
-    Defensive: DB errors return 503 and are logged.
+    DB errors return 503 and are logged; anything else propagates to Flask.
     """
     try:
-        try:
-            s = Setting.query.get("checkout_discount")
-        except Exception as db_exc:
-            current_app.logger.exception(
-                "Database error reading checkout_discount: %s", db_exc)
-            return jsonify({"error": "database_unavailable", "message": "Settings temporarily unavailable"}), 503
-
-        try:
-            percent = float(s.value) if s and s.value is not None else 0.0
-        except Exception:
-            percent = 0.0
-        return jsonify({"percent": percent})
-    except Exception as e:
+        percent = get_setting_cached(
+            "checkout_discount", ("checkout_discount",), _load_checkout_discount)
+    except SQLAlchemyError as db_exc:
         current_app.logger.exception(
-            "Unexpected error in get_checkout_discount: %s", e)
-        return jsonify({"error": "internal_error", "message": "An unexpected error occurred"}), 500
+            "Database error reading checkout_discount: %s", db_exc)
+        return jsonify({"error": "database_unavailable", "message": "Settings temporarily unavailable"}), 503
+    # fetched on every storefront page: let browsers/proxies reuse it briefly and
+    # revalidate with If-None-Match (304, no body) afterwards
+    resp = jsonify({"percent": percent})
+    resp.add_etag()
+    resp.cache_control.public = True
+    resp.cache_control.max_age = 60
+    return resp.make_conditional(request)
 
 
 @settings_bp.route("/api/settings/checkout_discount", methods=["PUT"])
+@admin_required
 def update_checkout_discount():
     """
     Set checkout discount percent.
     Requires admin session (session['user'] == 'admin' or 'admin@example.com').
     """
-    if session.get("user") not in ("admin", "admin@example.com"):
-        return jsonify({"error": "Unauthorized"}), 401
-
     data = request.get_json(silent=True) or {}
     try:
         percent = float(data.get("percent", 0))
@@ -62,13 +148,14 @@ def update_checkout_discount():
         return jsonify({"error": "Percent must be between 0 and 100"}), 400
 
     try:
-        s = Setting.query.get("checkout_discount")
+        s = db.session.get(Setting, "checkout_discount")
         if not s:
             s = Setting(key="checkout_discount", value=str(percent))
             db.session.add(s)
         else:
             s.value = str(percent)
         db.session.commit()
+        _SETTING_CACHE.pop("checkout_discount", None)
         return jsonify({"success": True, "percent": percent})
     except Exception as e:
         try:
@@ -89,6 +176,33 @@ def update_checkout_discount():
 # -----------------------
 
 
+def _to_float_maybe(v):
+    if v is None or v == "":
+        return None
+    try:
+        return float(v)
+    except Exception:
+        return None
+
+
+def _clean_competitor(c):
+    """Normalized competitor entry, or None when c is not a dict or lacks name/product_id."""
+    if not isinstance(c, dict):
+        return None
+    name = (c.get("name") or "").strip()
+    product_id = (c.get("product_id") or "").strip()
+    if not name or not product_id:
+        return None
+    return {
+        "name": name,
+        "product_id": product_id,
+        "our_price": _to_float_maybe(c.get("our_price")),
+        "competitor_price": _to_float_maybe(
+            c.get("competitor_price") or c.get("manual_price")),
+        "margin": _to_float_maybe(c.get("margin"))
+    }
+
+
 @settings_bp.route("/api/settings/price_comparison", methods=["GET"])
 def get_price_comparison_settings():
     """
@@ -97,56 +211,26 @@ def get_price_comparison_settings():
       "competitors": [ {name, product_id, our_price?, competitor_price?, margin?}, ... ],
       "global_margin": <number>
     }
-    Defensive: catches DB errors and returns 503.
+    DB errors return 503 and are logged; anything else propagates to Flask.
     """
     try:
-        try:
-            s = Setting.query.get("price_comparison_competitors")
-        except Exception as db_exc:
-            current_app.logger.exception(
-                "Database error reading price_comparison_competitors: %s", db_exc)
-            return jsonify({"error": "database_unavailable", "message": "Settings temporarily unavailable"}), 503
-
-        competitors = []
-        if s and s.value:
-            try:
-                competitors = json.loads(s.value)
-            except Exception:
-                current_app.logger.debug(
-                    "Invalid JSON in price_comparison_competitors setting; returning empty list")
-                competitors = []
-
-        try:
-            gm = Setting.query.get("price_comparison_global_margin")
-        except Exception as db_exc:
-            current_app.logger.exception(
-                "Database error reading price_comparison_global_margin: %s", db_exc)
-            return jsonify({"error": "database_unavailable", "message": "Settings temporarily unavailable"}), 503
-
-        global_margin = 0.0
-        try:
-            global_margin = float(
-                gm.value) if gm and gm.value is not None else 0.0
-        except Exception:
-            global_margin = 0.0
-
-        return jsonify({"competitors": competitors, "global_margin": global_margin})
-    except Exception as e:
+        settings = get_setting_cached(
+            "price_comparison", _PRICE_COMPARISON_KEYS, _load_price_comparison)
+    except SQLAlchemyError as db_exc:
         current_app.logger.exception(
-            "Failed to get price comparison settings: %s", e)
-        return jsonify({"error": "internal_error", "message": "Could not read settings"}), 500
+            "Database error reading price comparison settings: %s", db_exc)
+        return jsonify({"error": "database_unavailable", "message": "Settings temporarily unavailable"}), 503
+    return jsonify(settings)
 
 
 @settings_bp.route("/api/settings/price_comparison", methods=["PUT"])
+@admin_required
 def update_price_comparison_settings():
     """
     Accept JSON body: { "competitors": [...], "global_margin": <number> }
     Requires admin session.
     Validates structure and persists JSON.
     """
-    if session.get("user") not in ("admin", "admin@example.com"):
-        return jsonify({"error": "Unauthorized"}), 401
-
     data = request.get_json(silent=True) or {}
     competitors = data.get("competitors", [])
     global_margin = data.get("global_margin", None)
@@ -155,63 +239,34 @@ def update_price_comparison_settings():
         if not isinstance(competitors, list):
             return jsonify({"error": "competitors must be a list"}), 400
 
-        cleaned = []
-        for c in competitors:
-            if not isinstance(c, dict):
-                continue
-            name = (c.get("name") or "").strip()
-            product_id = (c.get("product_id") or "").strip()
-            if not name or not product_id:
-                continue
-
-            def to_float_maybe(v):
-                if v is None or v == "":
-                    return None
-                try:
-                    return float(v)
-                except Exception:
-                    return None
-
-            our_price = to_float_maybe(c.get("our_price"))
-            competitor_price = to_float_maybe(
-                c.get("competitor_price") or c.get("manual_price"))
-            margin = to_float_maybe(c.get("margin"))
-
-            cleaned.append({
-                "name": name,
-                "product_id": product_id,
-                "our_price": our_price,
-                "competitor_price": competitor_price,
-                "margin": margin
-            })
-
-        # save competitors JSON
+        cleaned = [e for e in map(_clean_competitor, competitors) if e is not None]
+
+        gm_val = None
+        if global_margin is not None:
+            try:
+                gm_val = float(global_margin)
+            except Exception:
+                return jsonify({"error": "global_margin must be a number"}), 400
+
         try:
-            s = Setting.query.get("price_comparison_competitors")
+            rows = _fetch_settings(_PRICE_COMPARISON_KEYS)
         except Exception as db_exc:
             current_app.logger.exception(
-                "Database error fetching setting for write: %s", db_exc)
+                "Database error fetching settings for write: %s", db_exc)
             return jsonify({"error": "database_unavailable", "message": "Settings temporarily unavailable"}), 503
 
+        # save competitors JSON (orjson via the app's JSON provider)
+        payload = current_app.json.dumps(cleaned)
+        s = rows.get("price_comparison_competitors")
         if not s:
-            s = Setting(key="price_comparison_competitors",
-                        value=json.dumps(cleaned))
+            s = Setting(key="price_comparison_competitors", value=payload)
             db.session.add(s)
         else:
-            s.value = json.dumps(cleaned)
+            s.value = payload
 
         # save optional global margin
-        if global_margin is not None:
-            try:
-                gm_val = float(global_margin)
-            except Exception:
-                return jsonify({"error": "global_margin must be a number"}), 400
-            try:
-                gm = Setting.query.get("price_comparison_global_margin")
-            except Exception as db_exc:
-                current_app.logger.exception(
-                    "Database error fetching margin setting for write: %s", db_exc)
-                return jsonify({"error": "database_unavailable", "message": "Settings temporarily unavailable"}), 503
+        if gm_val is not None:
+            gm = rows.get("price_comparison_global_margin")
             if not gm:
                 gm = Setting(key="price_comparison_global_margin",
                              value=str(gm_val))
@@ -220,6 +275,7 @@ def update_price_comparison_settings():
                 gm.value = str(gm_val)
 
         db.session.commit()
+        _SETTING_CACHE.pop("price_comparison", None)
         return jsonify({"success": True})
     except Exception as e:
         try:
@@ -232,13 +288,12 @@ def update_price_comparison_settings():
 
 
 @settings_bp.route("/api/settings/price_comparison/push", methods=["POST"])
+@admin_required
 def push_price_comparison_settings():
     """
     Admin-only endpoint that acts as a 'push' / publish hook for settings.
     Currently just logs and returns success.
     """
-    if session.get("user") not in ("admin", "admin@example.com"):
-        return jsonify({"error": "Unauthorized"}), 401
     try:
         current_app.logger.info(
             "Price comparison push triggered by admin user %s", session.get("user"))
@@ -0,0 +1,21 @@
+"""gunicorn.conf.py
+
+Gunicorn picks this file up automatically when started from the project root
+(e.g. `gunicorn run:app`).
+
+Uses threaded workers (gthread): admin refunds and PayPal checkout calls block
+on outbound HTTP for hundreds of milliseconds, and with threads the other
+requests in the same worker keep being served while one waits on PayPal.
+Each thread holds at most one DB connection; the per-worker pool defaults to
+GUNICORN_THREADS + 1 connections (app/__init__.py), so it follows this setting.
+If SQL_POOL_SIZE is set explicitly, keep GUNICORN_THREADS at or below
+SQL_POOL_SIZE + SQL_MAX_OVERFLOW.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
@@ -0,0 +1,181 @@
+"""add payment_admin_actions table
+
+Revision ID: c5e1b7d93a42
+Revises: a02d7bceccf0
+Create Date: 2026-10-15 22:31:07.418263
+
+"""
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e1b7d93a42'
+down_revision = 'a02d7bceccf0'
+branch_labels = None
+depends_on = None
+
+
+# Lightweight table definitions for the data steps (migrations must not import
+# the app's models, which track the latest schema rather than this revision's).
+_payments = sa.table(
+    "payments",
+    sa.column("id", sa.Integer),
+    sa.column("raw_response", sa.JSON),
+)
+_actions = sa.table(
+    "payment_admin_actions",
+    sa.column("payment_id", sa.Integer),
+    sa.column("actor_username", sa.String),
+    sa.column("actor_role", sa.String),
+    sa.column("action", sa.String),
+    sa.column("refund_amount", sa.Numeric(12, 2)),
+    sa.column("refund_percent", sa.Numeric(12, 2)),
+    sa.column("note", sa.Text),
+    sa.column("detail", sa.JSON),
+    sa.column("created_at", sa.DateTime),
+)
+# action-record keys that have their own column; the rest goes into detail
+_RECORD_FIELDS = frozenset(
+    {"timestamp", "actor", "action", "refund_amount", "refund_percent", "note"})
+
+
+def _as_dict(raw):
+    """raw_response as a dict (older rows may hold a JSON string), else None."""
+    if isinstance(raw, (str, bytes)):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            return None
+    return raw if isinstance(raw, dict) else None
+
+
+def _decimal_or_none(value):
+    if value is None or value == "":
+        return None
+    try:
+        d = Decimal(str(value))
+    except Exception:
+        return None
+    if not d.is_finite() or abs(d) >= Decimal("1e10"):
+        return None
+    return d
+
+
+def _created_at(timestamp, fallback):
+    """Naive UTC datetime from a record's ISO timestamp (fallback if missing/invalid)."""
+    try:
+        ts = datetime.fromisoformat(str(timestamp))
+    except ValueError:
+        return fallback
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _action_row(payment_id, record, fallback):
+    actor = record.get("actor") if isinstance(record.get("actor"), dict) else {}
+    detail = {k: v for k, v in record.items() if k not in _RECORD_FIELDS}
+    return {
+        "payment_id": payment_id,
+        "actor_username": actor.get("username"),
+        "actor_role": actor.get("role"),
+        "action": (record.get("action") or "unknown")[:40],
+        "refund_amount": _decimal_or_none(record.get("refund_amount")),
+        "refund_percent": _decimal_or_none(record.get("refund_percent")),
+        "note": record.get("note") or None,
+        "detail": detail or None,
+        "created_at": _created_at(record.get("timestamp"), fallback),
+    }
+
+
+def _record(row):
+    """Inverse of _action_row, for downgrade."""
+    record = dict(row.detail or {}) if isinstance(row.detail, dict) else {}
+    record.update({
+        "timestamp": row.created_at.isoformat() if row.created_at else None,
+        "actor": {"username": row.actor_username, "role": row.actor_role},
+        "action": row.action,
+        "refund_amount": float(row.refund_amount) if row.refund_amount is not None else None,
+        "refund_percent": float(row.refund_percent) if row.refund_percent is not None else None,
+        "note": row.note,
+    })
+    return record
+
+
+def _backfill_admin_actions():
+    """
+    Move every raw_response["_admin_actions"] entry (where actions were kept
+    before this table existed) into payment_admin_actions, so the whole audit
+    history lives in one place, and drop the key from raw_response.
+    """
+    bind = op.get_bind()
+    fallback = datetime.now(timezone.utc).replace(tzinfo=None)
+    for payment_id, raw in bind.execute(
+            sa.select(_payments.c.id, _payments.c.raw_response)).all():
+        rr = _as_dict(raw)
+        if rr is None or "_admin_actions" not in rr:
+            continue
+        records = rr.pop("_admin_actions")
+        rows = [_action_row(payment_id, r, fallback)
+                for r in (records if isinstance(records, list) else [])
+                if isinstance(r, dict)]
+        if rows:
+            bind.execute(_actions.insert(), rows)
+        bind.execute(_payments.update().where(_payments.c.id == payment_id)
+                     .values(raw_response=rr))
+
+
+def _restore_admin_actions():
+    """Downgrade: put the actions back into raw_response["_admin_actions"]."""
+    bind = op.get_bind()
+    by_payment = {}
+    for row in bind.execute(sa.select(_actions).order_by(
+            _actions.c.payment_id, _actions.c.created_at)).all():
+        by_payment.setdefault(row.payment_id, []).append(_record(row))
+    for payment_id, records in by_payment.items():
+        raw = bind.execute(sa.select(_payments.c.raw_response)
+                           .where(_payments.c.id == payment_id)).scalar()
+        rr = _as_dict(raw) or {}
+        rr["_admin_actions"] = records
+        bind.execute(_payments.update().where(_payments.c.id == payment_id)
+                     .values(raw_response=rr))
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('payment_admin_actions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('payment_id', sa.Integer(), nullable=False),
+    sa.Column('actor_username', sa.String(length=255), nullable=True),
+    sa.Column('actor_role', sa.String(length=64), nullable=True),
+    sa.Column('action', sa.String(length=40), nullable=False),
+    sa.Column('refund_amount', sa.Numeric(precision=12, scale=2), nullable=True),
+    sa.Column('refund_percent', sa.Numeric(precision=12, scale=2), nullable=True),
+    sa.Column('note', sa.Text(), nullable=True),
+    sa.Column('detail', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['payment_id'], ['payments.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('payment_admin_actions', schema=None) as batch_op:
+        batch_op.create_index('ix_payment_admin_actions_payment_id_created_at', ['payment_id', 'created_at'], unique=False)
+
+    # ### end Alembic commands ###
+
+    _backfill_admin_actions()
+
+
+def downgrade():
+    _restore_admin_actions()
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('payment_admin_actions', schema=None) as batch_op:
+        batch_op.drop_index('ix_payment_admin_actions_payment_id_created_at')
+
+    op.drop_table('payment_admin_actions')
+    # ### end Alembic commands ###
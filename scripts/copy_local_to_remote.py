@@ -2,8 +2,11 @@
 """
 One-off copy script: copy rows from LOCAL_DB -> REMOTE_DB for small datasets.
 Set LOCAL_DB and REMOTE_DB environment variables before running.
+COPY_ROW_LIMIT caps rows per table (default 500; 0 copies everything).
 """
 import os, sys
+import csv
+import io
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -17,46 +20,109 @@ print("Connecting to LOCAL_DB:", LOCAL_DB)
 print("Connecting to REMOTE_DB:", REMOTE_DB.split('@')[-1] if '@' in REMOTE_DB else REMOTE_DB)
 
 local = create_engine(LOCAL_DB)
-remote = create_engine(REMOTE_DB)
+# psycopg2 runs plain executemany one statement at a time; batch it instead
+remote_opts = {"executemany_mode": "values_plus_batch"} if REMOTE_DB.startswith(("postgres", "postgresql")) else {}
+# one connection for the whole run; pre-ping catches a remote that dropped it idle
+remote = create_engine(REMOTE_DB, pool_pre_ping=True, **remote_opts)
+
+# Postgres targets (psycopg2) take rows through COPY ... FROM STDIN
+use_copy = remote.dialect.name == "postgresql" and remote.dialect.driver == "psycopg2"
+
+
+def copy_value(v):
+    # CSV field for COPY: None -> \N (the NULL marker below), bytes -> bytea hex
+    if v is None:
+        return "\\N"
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        return "\\x" + bytes(v).hex()
+    return v
+
+
+def copy_rows(rconn, table, col_sql, cols, rows):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    for r in rows:
+        w.writerow([copy_value(r[c]) for c in cols])
+    buf.seek(0)
+    cur = rconn.connection.cursor()
+    try:
+        cur.copy_expert(
+            f"COPY {table} ({col_sql}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buf)
+    finally:
+        cur.close()
+
+
+def load_batch(rconn, t, cols, payload):
+    """Insert one batch of row dicts into t: COPY, else executemany, else row by row."""
+    col_sql = ",".join(cols)
+    if use_copy:
+        try:
+            with rconn.begin_nested():
+                copy_rows(rconn, t, col_sql, cols, payload)
+            return
+        except Exception as e:
+            print(f"COPY into {t} failed ({e.__class__.__name__}); falling back to INSERT")
+    placeholders = ",".join([f":{c}" for c in cols])
+    insert_sql = text(f"INSERT INTO {t} ({col_sql}) VALUES ({placeholders})")
+    try:
+        # whole batch in one executemany
+        with rconn.begin_nested():
+            rconn.execute(insert_sql, payload)
+        return
+    except SQLAlchemyError as e:
+        print(f"Batch insert into {t} failed ({e.__class__.__name__}); retrying row by row")
+    for data in payload:
+        try:
+            with rconn.begin_nested():
+                rconn.execute(insert_sql, data)
+        except SQLAlchemyError as e:
+            # try insert without id if primary key conflict
+            if "id" in data:
+                data_noid = {k: v for k, v in data.items() if k != "id"}
+                cols2 = ",".join(data_noid.keys())
+                placeholders2 = ",".join([f":{c}" for c in data_noid.keys()])
+                insert_sql2 = text(f"INSERT INTO {t} ({cols2}) VALUES ({placeholders2})")
+                try:
+                    with rconn.begin_nested():
+                        rconn.execute(insert_sql2, data_noid)
+                except Exception as e2:
+                    print(f"Failed to insert row into {t} even after removing id: {e2}")
+            else:
+                print(f"Failed to insert row into {t}: {e}")
+
 
 candidates = ["brand","brands","product","products","setting","settings"]
 copied = []
+# rows per table (COPY_ROW_LIMIT=0 copies whole tables); rows are streamed from
+# a server-side cursor and loaded BATCH_SIZE at a time, so memory stays flat
+ROW_LIMIT = int(os.environ.get("COPY_ROW_LIMIT", "500"))
+BATCH_SIZE = 1000
 
-with local.connect() as lconn, remote.connect() as rconn:
+# Everything is committed once at the end; batches and fallback rows run in
+# savepoints so a failed insert only rolls back itself.
+with local.connect() as lconn, remote.connect() as rconn, rconn.begin():
     for t in candidates:
         try:
-            # check and fetch local rows if table exists
+            # check and stream local rows if table exists
+            sql = f"SELECT * FROM {t}" + (f" LIMIT {ROW_LIMIT}" if ROW_LIMIT > 0 else "")
             try:
-                rows = lconn.execute(text(f"SELECT * FROM {t} LIMIT 500")).fetchall()
+                result = lconn.execution_options(
+                    stream_results=True).execute(text(sql)).mappings()
             except Exception:
-                # table missing locally
+                # table missing locally; clear the failed transaction before the next table
+                lconn.rollback()
                 print(f"Local table '{t}' not present - skipping.")
                 continue
-            if not rows:
+            total = 0
+            for rows in result.partitions(BATCH_SIZE):
+                if not total:
+                    print(f"Copying rows for table '{t}' ...")
+                load_batch(rconn, t, list(rows[0].keys()), [dict(r) for r in rows])
+                total += len(rows)
+            if not total:
                 print(f"Local table '{t}' exists but has 0 rows - skipping.")
                 continue
-            print(f"Copying {len(rows)} rows for table '{t}' ...")
-            cols = list(rows[0].keys())
-            col_sql = ",".join(cols)
-            placeholders = ",".join([f":{c}" for c in cols])
-            insert_sql = text(f"INSERT INTO {t} ({col_sql}) VALUES ({placeholders})")
-            for r in rows:
-                data = dict(r)
-                try:
-                    rconn.execute(insert_sql, **data)
-                except SQLAlchemyError as e:
-                    # try insert without id if primary key conflict
-                    if "id" in data:
-                        data_noid = {k: v for k, v in data.items() if k != "id"}
-                        cols2 = ",".join(data_noid.keys())
-                        placeholders2 = ",".join([f":{c}" for c in data_noid.keys()])
-                        insert_sql2 = text(f"INSERT INTO {t} ({cols2}) VALUES ({placeholders2})")
-                        try:
-                            rconn.execute(insert_sql2, **data_noid)
-                        except Exception as e2:
-                            print(f"Failed to insert row into {t} even after removing id: {e2}")
-                    else:
-                        print(f"Failed to insert row into {t}: {e}")
+            print(f"Copied {total} rows for table '{t}'")
             copied.append(t)
         except Exception as e:
             print(f"Skipping {t} due to error: {e}")
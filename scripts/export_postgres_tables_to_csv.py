@@ -20,7 +20,12 @@ Output:
 """
 from pathlib import Path
 import csv
+import itertools
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from operator import itemgetter
 
 # Ensure project root is importable when running from scripts/
 proj_root = Path(__file__).resolve().parents[1]
@@ -28,7 +33,7 @@ if str(proj_root) not in sys.path:
     sys.path.insert(0, str(proj_root))
 
 try:
-    from app import create_app
+    from app import create_app, db
     from app.models import Brand, Product, HomepageProduct
 except Exception as e:
     print("Failed to import app or core models:", e)
@@ -54,90 +59,173 @@ for mdl in list(_optional_model_names):
 OUT_DIR = proj_root / "instance" / "csvs"
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# rows fetched per round-trip when streaming a table
+STREAM_CHUNK = 10000
+# tables exported concurrently (each on its own pooled connection)
+EXPORT_WORKERS = 6
+
+
+def select_sql(conn, model, cols, order_by, exprs=None):
+    """
+    SELECT of cols from model's table. exprs maps a column to the SQL expression
+    producing its CSV text where the raw value isn't what these exports write,
+    so the database does that per-row work rather than Python.
+    """
+    quote = conn.dialect.identifier_preparer.quote
+    exprs = exprs or {}
+    select_list = ", ".join(
+        f"{exprs[c]} AS {quote(c)}" if c in exprs else quote(c) for c in cols)
+    return "SELECT {} FROM {} ORDER BY {}".format(
+        select_list, quote(model.__table__.name), ", ".join(quote(c) for c in order_by))
+
+
+def raw_rows(conn, model, cols, order_by, exprs=None):
+    """
+    Yield plain tuples of cols from model's table, straight off the DBAPI cursor.
+    The exports only copy scalar columns, so ORM objects (identity map,
+    attribute instrumentation) would be pure overhead. Used for non-psycopg2
+    databases; psycopg2 exports go through copy_out instead.
+    """
+    sql = select_sql(conn, model, cols, order_by, exprs)
+    cur = conn.connection.cursor()
+    cur.arraysize = STREAM_CHUNK
+    try:
+        cur.execute(sql)
+        yield from cur
+    finally:
+        cur.close()
+
+
+def _iso(v):
+    # datetime column -> isoformat(), as the ORM export wrote it; sqlite hands back text
+    if v is None or v == "":
+        return ""
+    if isinstance(v, str):
+        try:
+            v = datetime.fromisoformat(v)
+        except ValueError:
+            return v
+    return v.isoformat()
+
 
 def write_rows(path: Path, header, rows):
-    with path.open("w", newline="", encoding="utf8") as f:
-        w = csv.writer(f)
+    """Write header + rows (any iterable; consumed once) to path."""
+    # writerows iterates in C; zip() against a counter tallies rows without a Python loop
+    counter = itertools.count()
+    # 1 MiB buffer; "\n" line endings, the same as the COPY path writes
+    with path.open("w", newline="", encoding="utf8", buffering=1 << 20) as f:
+        w = csv.writer(f, lineterminator="\n")
         w.writerow(header)
-        for r in rows:
-            w.writerow(r)
-    print(f"Wrote {path} ({len(rows)} rows)")
+        w.writerows(map(itemgetter(0), zip(rows, counter)))
+    # single write() so lines from concurrent exports don't interleave
+    print(f"Wrote {path} ({next(counter)} rows)\n", end="")
+
+
+def copy_out(conn, path: Path, model, cols, order_by, exprs=None):
+    """
+    Postgres: let the server encode the CSV (COPY ... TO STDOUT) and stream it
+    straight into path; no per-row Python work.
+    """
+    sql = "COPY ({}) TO STDOUT WITH (FORMAT CSV, HEADER)".format(
+        select_sql(conn, model, cols, order_by, exprs))
+    cur = conn.connection.cursor()
+    try:
+        with path.open("wb") as f:
+            cur.copy_expert(sql, f)
+        print(f"Wrote {path} ({cur.rowcount} rows)\n", end="")
+    finally:
+        cur.close()
+
+
+def export_table(engine, name, model, cols, order_by, exprs=None, copy_exprs=None, fix=None):
+    """
+    Write model's cols to OUT_DIR/<name>.csv over its own pooled connection
+    (tables are exported concurrently). exprs apply on every path; copy_exprs
+    only to COPY, and fix reshapes rows on the Python path instead.
+    """
+    path = OUT_DIR / f"{name}.csv"
+    with engine.connect() as conn:
+        if conn.dialect.driver == "psycopg2":
+            copy_out(conn, path, model, cols, order_by, {**(exprs or {}), **(copy_exprs or {})})
+            return
+        rows = raw_rows(conn, model, cols, order_by, exprs)
+        write_rows(path, cols, map(fix, rows) if fix else rows)
+
+
+def _warn_on_error(message, fn, *args, **kwargs):
+    # optional exports only report a failure; the rest of the run carries on
+    try:
+        fn(*args, **kwargs)
+    except Exception as e:
+        print(f"{message} {e}\n", end="")
+
+
+def _bool_text(col):
+    # Python's str(bool(v)): True / False, NULL counting as False
+    return f"CASE WHEN {col} THEN 'True' ELSE 'False' END"
 
 
 def main():
     app = create_app()
     with app.app_context():
+        engine = db.engine
+        # NULLs come back as None, which csv writes as "" (what the exports always used)
+        jobs = []
+
         # BRANDS
-        brands = [(b.name or "", b.description or "")
-                  for b in Brand.query.order_by(Brand.name).all()]
-        write_rows(OUT_DIR / "brand.csv", ["name", "description"], brands)
+        jobs.append(partial(export_table, engine, "brand", Brand,
+                            ["name", "description"], ["name"]))
 
         # PRODUCTS
-        products = []
-        for p in Product.query.order_by(Product.id).all():
-            products.append([
-                p.id or "",
-                p.brand or "",
-                p.title or "",
-                p.price if p.price is not None else "",
-                p.description or "",
-                getattr(p, "keyNotes", "") or "",
-                p.image_url or "",
-                p.thumbnails or "",
-                p.status or "",
-                p.quantity if p.quantity is not None else "",
-                p.tags or ""
-            ])
-        write_rows(OUT_DIR / "product.csv", ["id", "brand", "title", "price", "description",
-                   "keyNotes", "image_url", "thumbnails", "status", "quantity", "tags"], products)
+        jobs.append(partial(export_table, engine, "product", Product,
+                            ["id", "brand", "title", "price", "description", "keyNotes",
+                             "image_url", "thumbnails", "status", "quantity", "tags"], ["id"]))
 
         # HOMEPAGE PRODUCTS
-        try:
-            hps = []
-            for h in HomepageProduct.query.order_by(HomepageProduct.section, HomepageProduct.sort_order).all():
-                hps.append([h.homepage_id, h.section, h.product_id or "",
-                           h.sort_order or 0, bool(h.visible)])
-            write_rows(OUT_DIR / "homepage_product.csv",
-                       ["homepage_id", "section", "product_id", "sort_order", "visible"], hps)
-        except Exception as e:
-            print("Skipping homepage_product export (model missing or error):", e)
+        jobs.append(partial(_warn_on_error, "Skipping homepage_product export (model missing or error):",
+                            export_table, engine, "homepage_product", HomepageProduct,
+                            ["homepage_id", "section", "product_id", "sort_order", "visible"],
+                            ["section", "sort_order"],
+                            exprs={"sort_order": "COALESCE(sort_order, 0)",
+                                   "visible": _bool_text("visible")}))
 
         # Optional: Coupon
         Coupon = _optional_models.get("coupon")
         if Coupon:
-            try:
-                coupons = []
-                for c in Coupon.query.order_by(getattr(Coupon, "code", "code")).all():
-                    coupons.append([c.code or "", c.description or "", c.discount_type or "", c.discount_value or "",
-                                   c.start_date or "", c.end_date or "", bool(getattr(c, "active", False))])
-                write_rows(OUT_DIR / "coupon.csv", ["code", "description", "discount_type",
-                           "discount_value", "start_date", "end_date", "active"], coupons)
-            except Exception as e:
-                print("Warning: coupon export failed:", e)
+            jobs.append(partial(_warn_on_error, "Warning: coupon export failed:",
+                                export_table, engine, "coupon", Coupon,
+                                ["code", "description", "discount_type",
+                                 "discount_value", "start_date", "end_date", "active"], ["code"],
+                                exprs={"discount_value": "NULLIF(discount_value, 0)",
+                                       "active": _bool_text("active")}))
 
         # Optional: Story
         Story = _optional_models.get("story")
         if Story:
-            try:
-                stories = []
-                for s in Story.query.order_by(getattr(Story, "id", "id")).all():
-                    stories.append([s.id or "", s.title or "", s.slug or "", s.section or "", s.excerpt or "", s.body_html or "", s.author or "", s.featured_image or "", bool(
-                        getattr(s, "published", False)), getattr(s, "published_at", None).isoformat() if getattr(s, "published_at", None) else ""])
-                write_rows(OUT_DIR / "story.csv", ["id", "title", "slug", "section", "excerpt",
-                           "body_html", "author", "featured_image", "published", "published_at"], stories)
-            except Exception as e:
-                print("Warning: story export failed:", e)
+            jobs.append(partial(_warn_on_error, "Warning: story export failed:",
+                                export_table, engine, "story", Story,
+                                ["id", "title", "slug", "section", "excerpt",
+                                 "body_html", "author", "featured_image", "published", "published_at"],
+                                ["id"],
+                                exprs={"published": _bool_text("published")},
+                                # isoformat() text: Postgres can do it, sqlite's stored form needs _iso
+                                copy_exprs={"published_at": "replace(published_at::text, ' ', 'T')"},
+                                fix=lambda r: (*r[:9], _iso(r[9]))))
 
         # Optional: Setting
         Setting = _optional_models.get("setting")
         if Setting:
-            try:
-                settings = []
-                for st in Setting.query.order_by(getattr(Setting, "key", "key")).all():
-                    settings.append([st.key or "", st.value or ""])
-                write_rows(OUT_DIR / "setting.csv", ["key", "value"], settings)
-            except Exception as e:
-                print("Warning: setting export failed:", e)
+            jobs.append(partial(_warn_on_error, "Warning: setting export failed:",
+                                export_table, engine, "setting", Setting, ["key", "value"], ["key"]))
+
+        # The tables are independent: export them side by side so one table's
+        # query overlaps another's disk writes. Brand/product failures still
+        # abort the run (result() re-raises), as they did when run in sequence.
+        pool_size = getattr(engine.pool, "size", None)
+        workers = min(EXPORT_WORKERS, pool_size() if callable(pool_size) else EXPORT_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            for fut in [ex.submit(job) for job in jobs]:
+                fut.result()
 
     print("CSV export complete. Files are in:", OUT_DIR)
 
@@ -24,6 +24,8 @@ Usage:
 # Ensure project root is on sys.path so "from app import ..." works when running as a script
 from app.models import Brand, Product
 from app import create_app, db
+from sqlalchemy import insert
+import os
 import re
 import argparse
 import sys
@@ -47,45 +49,107 @@ BRAND_NAME_MAP = {
 
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
 
+# column values every imported product starts with
+_DEFAULT_DESC = "Imported from static images"
+_DEFAULT_STATUS = "restocked"
+_DEFAULT_PRICE = 0.0
+_DEFAULT_QUANTITY = 10
+_EMPTY = ""
+
+# writes committed per transaction (a brand folder is committed when it ends)
+COMMIT_BATCH = 500
+
+
+_SLUG_RE = re.compile(r'[^A-Za-z0-9_]')
+_SEP_RE = re.compile(r'[_\-]+')
+_WS_RE = re.compile(r'\s+')
+
 
 def slugify_id(s: str) -> str:
-    return re.sub(r'[^A-Za-z0-9_]', '', s).upper()
+    return _SLUG_RE.sub('', s).upper()
 
 
 def title_from_filename(name: str) -> str:
-    t = re.sub(r'[_\-]+', ' ', name)
-    t = re.sub(r'\s+', ' ', t).strip()
+    t = _SEP_RE.sub(' ', name)
+    t = _WS_RE.sub(' ', t).strip()
+    # str.title() is one C-level pass; per-word capitalize in Python is ~10x
+    # slower, and would change titles like "Creed Aventus2X" already in the DB
     return t.title()
 
 
-def find_logo_for_brand(static_images_dir: Path, folder_name: str) -> str | None:
+def image_names(folder) -> list[str]:
+    """
+    Sorted image file names in folder. os.scandir entries carry the file type
+    from the directory read itself, so there is no stat() per entry.
+    """
+    with os.scandir(folder) as it:
+        return sorted(e.name for e in it
+                      if e.is_file() and os.path.splitext(e.name)[1].lower() in IMAGE_EXTS)
+
+
+def list_brand_images(static_images_dir: Path) -> list[tuple[str, str]]:
+    """
+    (name, lowercased name) of the image files under images/brands/, listed
+    once per run for find_logo_for_brand.
+    """
     brands_folder = static_images_dir / "brands"
     if not brands_folder.exists():
-        return None
-    candidates = []
-    for f in brands_folder.iterdir():
-        if not f.is_file():
-            continue
-        if f.suffix.lower() not in IMAGE_EXTS:
-            continue
-        fn = f.name.lower()
-        if folder_name.lower() in fn and "logo" in fn:
-            candidates.append(f)
-    # fallback: any file containing folder_name
-    if not candidates:
-        for f in brands_folder.iterdir():
-            if not f.is_file():
-                continue
-            if f.suffix.lower() not in IMAGE_EXTS:
-                continue
-            if folder_name.lower() in f.name.lower():
-                candidates.append(f)
-    if candidates:
-        rel = f"images/brands/{candidates[0].name}"
-        return rel
+        return []
+    return [(name, name.lower()) for name in image_names(brands_folder)]
+
+
+def find_logo_for_brand(brand_images: list[tuple[str, str]], folder_name: str) -> str | None:
+    # first file naming the folder and "logo"; else the first naming the folder
+    folder_name = folder_name.lower()
+    fallback = None
+    for name, lower in brand_images:
+        if folder_name in lower:
+            if "logo" in lower:
+                return f"images/brands/{name}"
+            if fallback is None:
+                fallback = name
+    if fallback is not None:
+        return f"images/brands/{fallback}"
     return None
 
 
+def commit_pending(pending, new_products, counts):
+    """
+    Commit the queued writes as one transaction. pending holds (kind, label, fn)
+    tuples; fn() has already made its change in the session and kind is the
+    counts key to bump. new_products maps product id -> Product column dict;
+    the rows are inserted here with a single executemany. If the commit fails the batch is replayed one
+    write per transaction, so a bad row only loses itself (as with per-row
+    commits).
+    """
+    if not pending and not new_products:
+        return
+    rows = list(new_products.values())
+    try:
+        if rows:
+            db.session.execute(insert(Product), rows)
+        db.session.commit()
+        for kind, _, _ in pending:
+            counts[kind] += 1
+        counts["created"] += len(rows)
+    except Exception as e:
+        db.session.rollback()
+        print(f"  Batch of {len(pending) + len(new_products)} writes failed ({e.__class__.__name__}); retrying one by one")
+        writes = pending + [("created", f"create product {row['id']}",
+                             lambda row=row: db.session.execute(insert(Product), [row]))
+                            for row in rows]
+        for kind, label, fn in writes:
+            try:
+                fn()
+                db.session.commit()
+                counts[kind] += 1
+            except Exception as e2:
+                db.session.rollback()
+                print(f"  Failed to {label}: {e2}")
+    pending.clear()
+    new_products.clear()
+
+
 def run(dry_run=True, apply=False, force=False, set_brand_logos=False):
     app = create_app()
     with app.app_context():
@@ -94,87 +158,118 @@ def run(dry_run=True, apply=False, force=False, set_brand_logos=False):
             print("No images directory at", static_images_dir)
             return
 
-        created_brands = 0
-        created_products = 0
-        updated_products = 0
+        counts = {"brands": 0, "logos": 0, "created": 0, "updated": 0}
         skipped = 0
+        pending = []
+        # created products not inserted yet: id -> column dict
+        new_products = {}
 
-        for brand_folder in sorted([p for p in static_images_dir.iterdir() if p.is_dir()]):
-            folder = brand_folder.name
+        # Everything the loop looks up is loaded here, once; past this point a
+        # dry run sends no queries at all.
+        brands_by_name = {b.name: b for b in Brand.query.all()}
+        # existing products: id -> (id, title) and (brand, title) -> (id, title)
+        existing_ids = {}
+        existing_bt = {}
+        for pid, pbrand, ptitle in db.session.query(Product.id, Product.brand, Product.title):
+            existing_ids[pid] = existing_bt[(pbrand, ptitle)] = (pid, ptitle)
+        # --force rewrites existing rows: hold them all so updates need no lookups
+        products_by_id = {p.id: p for p in Product.query.all()} if (force and apply) else {}
+        # ...and keep them loaded across the per-folder commits (nothing else writes them)
+        db.session().expire_on_commit = False
+
+        brand_images = list_brand_images(static_images_dir) if set_brand_logos else []
+
+        with os.scandir(static_images_dir) as it:
+            brand_folders = sorted((e.name, e.path) for e in it if e.is_dir())
+
+        for folder, brand_folder in brand_folders:
             display_name = BRAND_NAME_MAP.get(
                 folder, folder.replace('_', ' ').title())
             print(f"\nProcessing folder: {folder} -> Brand: {display_name}")
 
-            brand = Brand.query.filter_by(name=display_name).first()
+            brand = brands_by_name.get(display_name)
             if not brand:
                 print(
                     "  Brand not found in DB -> will create" if not dry_run else "  Would create Brand")
                 if apply:
-                    try:
-                        brand = Brand(
-                            name=display_name, description=f"Imported from images/{folder}")
+                    brand = Brand(
+                        name=display_name, description=f"Imported from images/{folder}")
+
+                    def add_brand(brand=brand):
                         db.session.add(brand)
-                        db.session.commit()
-                        created_brands += 1
-                        print(f"  Created Brand: {display_name}")
+                        # products reference brand.name; insert the brand first
+                        db.session.flush()
+                    try:
+                        add_brand()
                     except Exception as e:
                         db.session.rollback()
                         print(f"  Failed to create Brand {display_name}: {e}")
                         continue
+                    pending.append(("brands", f"create Brand {display_name}", add_brand))
+                    brands_by_name[display_name] = brand
             else:
                 print("  Brand exists in DB")
 
             # optionally set brand.logo from images/brands/*
             if set_brand_logos:
-                logo_rel = find_logo_for_brand(static_images_dir, folder)
+                logo_rel = find_logo_for_brand(brand_images, folder)
                 if logo_rel:
-                    if not brand.logo or force:
+                    # brand is None in a dry run when it would be created
+                    if not getattr(brand, "logo", None) or force:
                         print(f"  Setting brand.logo -> {logo_rel}")
                         if apply:
-                            try:
+                            def set_logo(brand=brand, logo_rel=logo_rel):
                                 brand.logo = logo_rel
-                                db.session.add(brand)
-                                db.session.commit()
-                            except Exception as e:
-                                db.session.rollback()
-                                print(f"  Failed to update brand.logo: {e}")
+                            set_logo()
+                            pending.append(
+                                ("logos", f"set logo for Brand {display_name}", set_logo))
 
             # iterate files for product creation
-            images = sorted([f for f in brand_folder.iterdir()
-                            if f.is_file() and f.suffix.lower() in IMAGE_EXTS])
+            images = image_names(brand_folder)
             if not images:
                 print("  (no image files)")
+                commit_pending(pending, new_products, counts)
                 continue
 
+            # per-folder parts of the per-image strings, built once
+            rel_prefix = "images/" + folder + "/"
+            id_prefix = folder + "_"
             for img in images:
-                name_noext = img.stem
-                raw_id = f"{folder}_{name_noext}"
+                # image_names() only returns names with an image extension
+                name_noext = img.rsplit(".", 1)[0]
+                raw_id = id_prefix + name_noext
                 prod_id = slugify_id(raw_id)
                 title = title_from_filename(name_noext)
-                image_rel = f"images/{folder}/{img.name}"
+                image_rel = rel_prefix + img
 
-                existing_by_id = Product.query.filter_by(id=prod_id).first()
-                existing_by_title = Product.query.filter_by(
-                    brand=display_name, title=title).first()
-                if existing_by_id or existing_by_title:
-                    p = existing_by_id or existing_by_title
+                found = existing_ids.get(prod_id) or existing_bt.get((display_name, title))
+                if found:
+                    found_id, found_title = found
                     if force:
                         print(
-                            f"  Will update existing product {p.id} image fields -> {image_rel}" if not dry_run else f"  Would update {p.id}")
+                            f"  Will update existing product {found_id} image fields -> {image_rel}" if not dry_run else f"  Would update {found_id}")
                         if apply:
-                            try:
+                            queued = new_products.get(found_id)
+                            if queued is not None:
+                                # created earlier in this batch, not inserted yet:
+                                # the insert itself carries the new image fields
+                                queued["image_url"] = queued["thumbnails"] = image_rel
+                                continue
+                            p = products_by_id.get(found_id) or db.session.get(Product, found_id)
+                            if p is None:
+                                # its create failed (already reported); nothing to update
+                                print(f"  Skipping update of {found_id}: product was not created")
+                                continue
+
+                            def update_images(p=p, image_rel=image_rel):
                                 p.image_url = image_rel
                                 p.thumbnails = image_rel
-                                db.session.add(p)
-                                db.session.commit()
-                                updated_products += 1
-                            except Exception as e:
-                                db.session.rollback()
-                                print(
-                                    f"  Failed to update product {p.id}: {e}")
+                            update_images()
+                            pending.append(
+                                ("updated", f"update product {p.id}", update_images))
                     else:
                         print(
-                            f"  Skipping existing product (id/title found): {p.id} / {p.title}")
+                            f"  Skipping existing product (id/title found): {found_id} / {found_title}")
                         skipped += 1
                     continue
 
@@ -182,31 +277,34 @@ def run(dry_run=True, apply=False, force=False, set_brand_logos=False):
                 print(
                     f"  Create Product -> id={prod_id} title='{title}' image='{image_rel}'" if not dry_run else f"  Would create Product id={prod_id} title='{title}'")
                 if apply:
-                    try:
-                        newp = Product(
-                            id=prod_id,
-                            brand=display_name,
-                            title=title,
-                            price=0.0,
-                            description="Imported from static images",
-                            keyNotes="",
-                            image_url=image_rel,
-                            thumbnails=image_rel,
-                            status="restocked",
-                            quantity=10,
-                            tags=""
-                        )
-                        db.session.add(newp)
-                        db.session.commit()
-                        created_products += 1
-                    except Exception as e:
-                        db.session.rollback()
-                        print(f"  Failed to create product {prod_id}: {e}")
+                    # plain column dicts, inserted in bulk by commit_pending
+                    new_products[prod_id] = dict(
+                        id=prod_id,
+                        brand=display_name,
+                        title=title,
+                        price=_DEFAULT_PRICE,
+                        description=_DEFAULT_DESC,
+                        keyNotes=_EMPTY,
+                        image_url=image_rel,
+                        thumbnails=image_rel,
+                        status=_DEFAULT_STATUS,
+                        quantity=_DEFAULT_QUANTITY,
+                        tags=_EMPTY
+                    )
+                    # later images mapping to the same id/title count as existing
+                    existing_ids[prod_id] = existing_bt[(display_name, title)] = (prod_id, title)
+                if len(pending) + len(new_products) >= COMMIT_BATCH:
+                    commit_pending(pending, new_products, counts)
+
+            # one commit for the rest of this brand folder
+            commit_pending(pending, new_products, counts)
 
         print("\nSummary:")
-        print(f"  Brands created: {created_brands}")
-        print(f"  Products created: {created_products}")
-        print(f"  Products updated: {updated_products}")
+        print(f"  Brands created: {counts['brands']}")
+        if set_brand_logos:
+            print(f"  Brand logos set: {counts['logos']}")
+        print(f"  Products created: {counts['created']}")
+        print(f"  Products updated: {counts['updated']}")
         print(f"  Products skipped (existing): {skipped}")
 
 